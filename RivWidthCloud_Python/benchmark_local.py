@@ -0,0 +1,215 @@
+"""benchmark of the local (numpy) RivWidthCloud pipeline on deterministic synthetic scenes with known widths
+
+every stage of rwGenSRLocal is timed separately, together with the components most often tuned (water classification,
+skeletonization, centerline cleaning, width measurement); the widths are compared with the analytic widths of the scene
+"""
+import math
+import time
+import numpy as np
+from collections import OrderedDict
+
+SCALE = 30.0
+CRS = 'EPSG:32616'
+# // clear-sky surface reflectance of water and land, classified as water and non-water by both methods
+WATER = {'Blue': 500, 'Green': 800, 'Red': 500, 'Nir': 300, 'Swir1': 100, 'Swir2': 50, 'BQA': 324}
+LAND = {'Blue': 400, 'Green': 700, 'Red': 600, 'Nir': 3000, 'Swir1': 2000, 'Swir2': 1200, 'BQA': 322}
+CASES = ['meander', 'braided', 'lake']
+
+def SyntheticScene(case, size, halfWidth = 8.0, seed = 0):
+    """(LocalImage, GRWL lines, expected) for a size x size scene; expected(cols) gives the true width (meters)
+    at the given columns, NaN where the width is not known (islands, lake)
+
+    the river meanders west to east around row size / 2 with center(c) = size / 2 + A sin(2 pi c / P), so its orthogonal
+    width is 2 halfWidth scale / sqrt(1 + center'(c) ** 2)
+    - braided: elliptical islands on the centerline, one per period
+    - lake: a disk of radius size / 6 in the middle of the scene
+    """
+    from functions_local import LocalImage, XYToLonLat
+
+    rng = np.random.default_rng(seed)
+    amplitude = size / 10.0
+    period = size / 3.0
+    phase = rng.uniform(0, 2 * math.pi)
+    rr, cc = np.mgrid[0:size, 0:size]
+    center = size / 2.0 + amplitude * np.sin(2 * math.pi * (cc + 0.5) / period + phase)
+    water = np.abs(rr + 0.5 - center) < halfWidth
+    unknown = np.zeros(size, dtype = bool)
+    cols = np.arange(size)
+
+    if case == 'braided':
+        halfWidth = halfWidth * 2
+        water = np.abs(rr + 0.5 - center) < halfWidth
+        islandLength = period / 8.0
+        for c0 in np.arange(period / 4.0, size, period):
+            island = ((cc + 0.5 - c0) / islandLength) ** 2 + ((rr + 0.5 - center) / (halfWidth / 2.0)) ** 2 < 1
+            water &= ~island
+            unknown |= np.abs(cols + 0.5 - c0) < islandLength + halfWidth
+    elif case == 'lake':
+        radius = size / 6.0
+        water |= (rr + 0.5 - size / 2.0) ** 2 + (cc + 0.5 - size / 2.0) ** 2 < radius ** 2
+        unknown |= np.abs(cols + 0.5 - size / 2.0) < radius + 3 * halfWidth
+    elif case != 'meander':
+        raise ValueError('unknown case {}'.format(case))
+
+    bands = OrderedDict((b, np.where(water, WATER[b], LAND[b]).astype(np.int16)) for b in WATER)
+    bands['uBlue'] = bands['Blue'].copy()
+    transform = (SCALE, 0.0, 500000.0, 0.0, -SCALE, 4000000.0)
+    image = LocalImage(bands, transform, CRS, {
+        'LANDSAT_ID': 'SYNTH_{}_{:06d}_{}'.format(case.upper(), size, seed), 'system:time_start': 0,
+        'SOLAR_AZIMUTH_ANGLE': 140.0, 'SOLAR_ZENITH_ANGLE': 40.0})
+
+    x = transform[2] + (cols + 0.5) * SCALE
+    y = transform[5] - center[0] * SCALE
+    lon, lat = XYToLonLat(x, y, CRS)
+    grwl = [np.stack([lon, lat], 1)]
+
+    def expected(c):
+        c = np.asarray(c, dtype = np.float64)
+        slope = amplitude * 2 * math.pi / period * np.cos(2 * math.pi * c / period + phase)
+        width = 2 * halfWidth * SCALE / np.sqrt(1 + slope ** 2)
+        return(np.where(unknown[np.clip(np.floor(c).astype(np.int64), 0, size - 1)], np.nan, width))
+
+    return(image, grwl, expected)
+
+def Measure(fun, memory):
+    """(result, seconds, peak bytes allocated or None) of calling fun
+    """
+    import tracemalloc
+
+    if memory:
+        tracemalloc.start()
+    t = time.perf_counter()
+    result = fun()
+    seconds = time.perf_counter() - t
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return(result, seconds, peak)
+
+def BenchmarkScene(image, grwl, expected, repeat = 3, memory = True, WATER_METHOD = 'Jones2019', MAXDISTANCE = 4000, FILL_SIZE = 333, DISTANCE_CAP = None):
+    """timings of each stage (best of repeat runs) and the accuracy of the widths for one scene
+    """
+    from functions_landsat_local import CalculateWaterAddFlagsSR, ClassifyWater
+    from functions_river_local import ExtractRiver
+    from functions_centerline_width_local import (CalculateCenterline, CalculateOrthAngle, CalculateWidth,
+        CalcOnePixelWidthCenterline, GetWidth)
+    from functions_centerline_graph_local import CleanCenterlineGraph
+
+    scale = image.get('scale')
+    inputs = {}
+
+    def stages():
+        yield('CalculateWaterAddFlagsSR', lambda: CalculateWaterAddFlagsSR(image, WATER_METHOD), 'flags')
+        yield('ExtractRiver', lambda: ExtractRiver(inputs['flags'], grwl, MAXDISTANCE, FILL_SIZE), 'river')
+        yield('CalculateCenterline', lambda: CalculateCenterline(inputs['river'], DISTANCE_CAP), 'centerline')
+        yield('CalculateOrthAngle', lambda: CalculateOrthAngle(inputs['centerline']), 'angle')
+        yield('CalculateWidth', lambda: CalculateWidth(inputs['angle']), 'widths')
+        # // components of the stages above
+        yield('ClassifyWater', lambda: ClassifyWater(image, WATER_METHOD), None)
+        yield('CalcOnePixelWidthCenterline', lambda: CalcOnePixelWidthCenterline(
+            inputs['river'].band('riverMask') == 1, inputs['centerline'].band('gradientMap'), 0.9), None)
+        yield('CleanCenterlineGraph', lambda: CleanCenterlineGraph(inputs['centerline'].band('rawCL'), 300, True, scale), None)
+        yield('GetWidth', lambda: GetWidth(inputs['angle'].band('orthDegree'), {}, inputs['angle'].band('riverMask'),
+            inputs['angle'].band('distanceMap'), image.crs, image.transform, inputs['angle'].footprint, scale, '', ''), None)
+
+    pixels = int(np.prod(image.shape))
+    records = OrderedDict()
+    for (name, fun, key) in stages():
+        best = None
+        for k in range(repeat):
+            result, seconds, _ = Measure(fun, False)
+            best = seconds if best is None else min(best, seconds)
+        peak = Measure(fun, True)[2] if memory else None
+        if key is not None:
+            inputs[key] = result
+        records[name] = OrderedDict([('seconds', best), ('pxPerSecond', pixels / best if best > 0 else None), ('peakBytes', peak)])
+
+    widths = inputs['widths']
+    nWidths = len(widths['width'])
+    for name in ('CalculateWidth', 'GetWidth'):
+        records[name]['widthsPerSecond'] = nWidths / records[name]['seconds'] if records[name]['seconds'] > 0 else None
+    return(records, Accuracy(widths, image, expected))
+
+def Accuracy(widths, image, expected, edge = 20):
+    """relative error of the widths against the known widths, at centerline pixels away from the scene edges,
+    not flagged as ending in water or over the edge, and where the width is known
+    """
+    from functions_local import LonLatToXY, PixelIndices
+
+    out = OrderedDict([('nWidths', int(len(widths['width'])))])
+    if not len(widths['width']):
+        out['nChecked'] = 0
+        return(out)
+    x, y = LonLatToXY(widths['longitude'], widths['latitude'], image.crs)
+    rows, cols = PixelIndices(image.transform, x, y)
+    truth = expected(cols)
+    nr, nc = image.shape
+    ok = (np.isfinite(truth) & (widths['endsInWater'] == 0) & (widths['endsOverEdge'] == 0) &
+          (rows > edge) & (rows < nr - edge) & (cols > edge) & (cols < nc - edge))
+    error = (widths['width'][ok] - truth[ok]) / truth[ok]
+    out['nChecked'] = int(ok.sum())
+    if ok.any():
+        out['medianRelativeBias'] = float(np.median(error))
+        error = np.abs(error)
+        out['medianRelativeError'] = float(np.median(error))
+        out['p95RelativeError'] = float(np.percentile(error, 95))
+    return(out)
+
+def Environment():
+    import platform
+    import scipy
+    return(OrderedDict([
+        ('python', platform.python_version()),
+        ('numpy', np.__version__),
+        ('scipy', scipy.__version__),
+        ('machine', platform.machine()),
+        ('processor', platform.processor()),
+        ('time', time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()))]))
+
+def RunBenchmark(cases = CASES, sizes = (500, 1000, 2000), repeat = 3, memory = True, seed = 0, **kwargs):
+    results = []
+    for case in cases:
+        for size in sizes:
+            image, grwl, expected = SyntheticScene(case, size, seed = seed)
+            stages, accuracy = BenchmarkScene(image, grwl, expected, repeat, memory, **kwargs)
+            results.append(OrderedDict([('case', case), ('size', size), ('pixels', size * size),
+                ('stages', stages), ('accuracy', accuracy)]))
+    return(OrderedDict([('environment', Environment()), ('results', results)]))
+
+if __name__ == '__main__':
+
+    import argparse
+    import json
+    import sys
+
+    parser = argparse.ArgumentParser(prog = 'benchmark_local.py',
+    description = "Time each stage of the local RivWidthCloud pipeline on synthetic scenes and check the widths against the known widths. \
+    (Example: python benchmark_local.py -c meander lake -s 500 1000 -o bench.json)")
+
+    parser.add_argument('-c', '--CASES', help = "Synthetic cases ('meander', 'braided', 'lake'). Default: all", nargs = '+', default = CASES)
+    parser.add_argument('-s', '--SIZES', help = 'Scene sizes (pixels per side). Default: 500 1000 2000', nargs = '+', type = int, default = [500, 1000, 2000])
+    parser.add_argument('-r', '--REPEAT', help = 'Runs per stage, the fastest is reported. Default: 3', type = int, default = 3)
+    parser.add_argument('-w', '--WATER_METHOD', help = "Water classification method ('Jones2019' or 'Zou2018'). Default: 'Jones2019'", type = str, default = 'Jones2019')
+    parser.add_argument('--DISTANCE_CAP', help = 'Distance map cap (pixels). Default: none', type = int, default = None)
+    parser.add_argument('--NO_MEMORY', help = 'Skip the (slower) peak memory measurement', action = 'store_true')
+    parser.add_argument('--SEED', help = 'Seed of the synthetic scenes. Default: 0', type = int, default = 0)
+    parser.add_argument('-e', '--MAX_ERROR', help = 'Exit with status 1 if any median relative width error exceeds this', type = float, default = None)
+    parser.add_argument('-o', '--OUTPUT', help = 'JSON output file. Default: standard output', type = str, default = None)
+
+    args = parser.parse_args()
+
+    report = RunBenchmark(args.CASES, args.SIZES, args.REPEAT, not args.NO_MEMORY, args.SEED,
+        WATER_METHOD = args.WATER_METHOD, DISTANCE_CAP = args.DISTANCE_CAP)
+
+    text = json.dumps(report, indent = 2)
+    if args.OUTPUT:
+        with open(args.OUTPUT, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.MAX_ERROR is not None:
+        errors = [r['accuracy'].get('medianRelativeError', float('inf')) for r in report['results']]
+        if max(errors) > args.MAX_ERROR:
+            sys.exit(1)
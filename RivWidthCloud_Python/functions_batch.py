@@ -1,25 +1,414 @@
-def maximum_no_of_tasks(MaxNActive, waitingPeriod):
-	"""maintain a maximum number of active tasks
+import threading
+import time
+
+ACTIVE_STATES = ('READY', 'RUNNING')
+
+# // legacy task states of the long-running operation states, as reported by the deprecated ee.data.getTaskStatus
+OPERATION_STATES = {'PENDING': 'READY', 'RUNNING': 'RUNNING', 'CANCELLING': 'CANCEL_REQUESTED',
+	'SUCCEEDED': 'COMPLETED', 'FAILED': 'FAILED', 'CANCELLED': 'CANCELLED'}
+
+def operation_state(operation):
+	"""legacy task state (READY, RUNNING, COMPLETED, ...) of an Earth Engine operation
+	"""
+	state = operation.get('metadata', {}).get('state')
+	return(OPERATION_STATES.get(state, state))
+
+def ee_task_status(taskIds):
+	"""default status provider: the state of each of the given task ids from Earth Engine
+
+	uses the operations API: ids given as operation names ('projects/<project>/operations/<id>') are looked up with
+	ee.data.getOperation, bare task ids (ee.batch.Task.id) among ee.data.listOperations; ids Earth Engine does not
+	know (e.g. expired) are left out of the result
 	"""
-	import time
 	import ee
-	ee.Initialize()
-
-	time.sleep(10)
-	## initialize submitting jobs
-	ts = list(ee.batch.Task.list())
-
-	NActive = 0
-	for task in ts:
-		if ('RUNNING' in str(task) or 'READY' in str(task)):
-			NActive += 1
-	## wait if the number of current active tasks reach the maximum number
-	## defined in MaxNActive
-	while (NActive >= MaxNActive):
-		time.sleep(waitingPeriod) # if reach or over maximum no. of active tasks, wait for 2min and check again
-		ts = list(ee.batch.Task.list())
-		NActive = 0
-		for task in ts:
-			if ('RUNNING' in str(task) or 'READY' in str(task)):
-				NActive += 1
+	taskIds = list(taskIds)
+	states = {}
+	bare = set()
+	for taskId in taskIds:
+		if '/' in taskId:
+			try:
+				states[taskId] = operation_state(ee.data.getOperation(taskId))
+			except ee.EEException:
+				pass
+		else:
+			bare.add(taskId)
+	if bare:
+		for operation in ee.data.listOperations():
+			taskId = operation['name'].rsplit('/', 1)[-1]
+			if taskId in bare:
+				states[taskId] = operation_state(operation)
+	return(states)
+
+class TaskTracker(object):
+	"""maintain a maximum number of active tasks among the tasks this tracker submitted
+
+	statusProvider maps a list of task ids to a dict of id -> state (see ee_task_status);
+	a slot is released as soon as one of the tracked tasks leaves READY/RUNNING.
+	while all slots are taken, statuses are polled with exponential backoff between minWait and maxWait seconds.
+	"""
+
+	def __init__(self, MaxNActive, statusProvider = ee_task_status, minWait = 1, maxWait = 30, backoff = 2, sleep = time.sleep, onFinish = None):
+		self.MaxNActive = MaxNActive
+		self.onFinish = onFinish
+		self.statusProvider = statusProvider
+		self.minWait = minWait
+		self.maxWait = maxWait
+		self.backoff = backoff
+		self.sleep = sleep
+		self.active = set()
+		self.finished = {}
+		self.reserved = 0
+		self.lock = threading.Lock()
+
+	def acquire(self):
+		"""block until a slot is free and reserve it for a task about to be submitted
+		"""
+		wait = self.minWait
+		while True:
+			with self.lock:
+				if len(self.active) + self.reserved < self.MaxNActive:
+					self.reserved += 1
+					return()
+				ids = list(self.active)
+			if self.poll(ids) == 0:
+				self.sleep(wait)
+				wait = min(wait * self.backoff, self.maxWait)
+			else:
+				wait = self.minWait
+
+	def add(self, taskId):
+		"""turn a reserved slot into a tracked task
+		"""
+		with self.lock:
+			self.reserved -= 1
+			self.active.add(taskId)
+
+	def track(self, taskId):
+		"""track a task submitted elsewhere, e.g. one left running by an earlier run (see JobLedger.reconcile)
+		"""
+		with self.lock:
+			self.active.add(taskId)
+
+	def release(self):
+		"""give back a reserved slot whose task was never submitted
+		"""
+		with self.lock:
+			self.reserved -= 1
+
+	def poll(self, ids = None):
+		"""query the tracked tasks that are still active; returns the number of slots freed
+		"""
+		if ids is None:
+			with self.lock:
+				ids = list(self.active)
+		if not ids:
+			return(0)
+		states = self.statusProvider(ids)
+		done = []
+		with self.lock:
+			for taskId in ids:
+				state = states.get(taskId)
+				if state is not None and state not in ACTIVE_STATES and taskId in self.active:
+					self.active.discard(taskId)
+					self.finished[taskId] = state
+					done.append((taskId, state))
+		if self.onFinish is not None:
+			for (taskId, state) in done:
+				self.onFinish(taskId, state)
+		return(len(done))
+
+	def wait_all(self):
+		"""block until none of the tracked tasks is active
+		"""
+		wait = self.minWait
+		while self.active:
+			if self.poll() == 0:
+				self.sleep(wait)
+				wait = min(wait * self.backoff, self.maxWait)
+			else:
+				wait = self.minWait
+
+def param_hash(params):
+	"""stable hash of the run parameters (WATER_METHOD, MAXDISTANCE, ..., point location and radius) that identify a job
+	"""
+	import hashlib
+	import json
+	return(hashlib.sha1(json.dumps(params, sort_keys = True).encode('utf-8')).hexdigest())
+
+class JobLedger(object):
+	"""persistent record (SQLite) of the batch jobs, keyed by LANDSAT_ID and parameter hash
+
+	each job is SUBMITTED (with its task id), COMPLETED or FAILED; attempts counts the submissions.
+	"""
+
+	def __init__(self, path):
+		import sqlite3
+		self.lock = threading.Lock()
+		self.db = sqlite3.connect(path, check_same_thread = False)
+		with self.db:
+			self.db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+				landsat_id TEXT NOT NULL,
+				param_hash TEXT NOT NULL,
+				export_prefix TEXT,
+				state TEXT NOT NULL,
+				task_id TEXT,
+				attempts INTEGER NOT NULL DEFAULT 0,
+				error TEXT,
+				updated REAL,
+				PRIMARY KEY (landsat_id, param_hash))""")
+			self.db.execute("CREATE INDEX IF NOT EXISTS jobs_task_id ON jobs (task_id)")
+
+	def get(self, landsatId, paramHash):
+		with self.lock:
+			row = self.db.execute("SELECT state, task_id, attempts FROM jobs WHERE landsat_id = ? AND param_hash = ?", (landsatId, paramHash)).fetchone()
+		return(row)
+
+	def should_run(self, landsatId, paramHash, maxAttempts):
+		"""False for finished jobs, jobs still in flight and failed jobs that used up their retry budget
+		"""
+		row = self.get(landsatId, paramHash)
+		if row is None:
+			return(True)
+		state, taskId, attempts = row
+		if state == 'FAILED':
+			return(attempts < maxAttempts)
+		return(False)
+
+	def submitted(self, landsatId, paramHash, exportPrefix, taskId, countAttempt = True):
+		"""countAttempt = False for a scene submitted as part of a chunk, whose failure is not charged to the scene
+		"""
+		with self.lock, self.db:
+			self.db.execute("""INSERT INTO jobs (landsat_id, param_hash, export_prefix, state, task_id, attempts, error, updated)
+				VALUES (?, ?, ?, 'SUBMITTED', ?, ?, NULL, ?)
+				ON CONFLICT (landsat_id, param_hash) DO UPDATE SET
+				export_prefix = excluded.export_prefix, state = 'SUBMITTED', task_id = excluded.task_id,
+				attempts = jobs.attempts + excluded.attempts, error = NULL, updated = excluded.updated""",
+				(landsatId, paramHash, exportPrefix, taskId, int(countAttempt), time.time()))
+
+	def failed(self, landsatId, paramHash, exportPrefix, error, countAttempt = True):
+		# // a job that failed before its task could be started
+		with self.lock, self.db:
+			self.db.execute("""INSERT INTO jobs (landsat_id, param_hash, export_prefix, state, task_id, attempts, error, updated)
+				VALUES (?, ?, ?, 'FAILED', NULL, ?, ?, ?)
+				ON CONFLICT (landsat_id, param_hash) DO UPDATE SET
+				export_prefix = excluded.export_prefix, state = 'FAILED', attempts = jobs.attempts + excluded.attempts,
+				error = excluded.error, updated = excluded.updated""",
+				(landsatId, paramHash, exportPrefix, int(countAttempt), str(error), time.time()))
+
+	def finished(self, taskId, state, error = None):
+		"""record the final server state of a task (usable as TaskTracker onFinish)
+		"""
+		with self.lock, self.db:
+			self.db.execute("UPDATE jobs SET state = ?, error = ?, updated = ? WHERE task_id = ?",
+				('COMPLETED' if state == 'COMPLETED' else 'FAILED', error, time.time(), taskId))
+
+	def reconcile(self, statusProvider = ee_task_status):
+		"""update jobs left SUBMITTED by an earlier (possibly crashed) run; returns the task ids still active
+
+		jobs whose task the status provider does not know (e.g. expired ids) are marked FAILED, so they are retried
+		within the retry budget
+		"""
+		with self.lock:
+			ids = [row[0] for row in self.db.execute("SELECT task_id FROM jobs WHERE state = 'SUBMITTED'")]
+		if not ids:
+			return([])
+		states = statusProvider(ids)
+		active = []
+		for taskId in ids:
+			state = states.get(taskId)
+			if state in ACTIVE_STATES:
+				active.append(taskId)
+			elif state is None:
+				self.finished(taskId, 'UNKNOWN', 'task status unknown')
+			else:
+				self.finished(taskId, state)
+		return(active)
+
+def point_sites(points, RADIUS):
+	"""FeatureCollection of the buffered regions of POINT mode around points, a list of (Point_ID, Longitude, Latitude),
+	each feature carrying its Point_ID
+	"""
+	import ee
+	return(ee.FeatureCollection([ee.Feature(ee.Geometry.Point([lon, lat], "EPSG:4326").buffer(RADIUS).bounds(), {'Point_ID': pointId})
+		for (pointId, lon, lat) in points]))
+
+def point_widths(rwc, img, sites):
+	"""widths of the sites (see point_sites) in one scene: rwc runs once over the union of the site regions and each width
+	is assigned to every site containing it, with that site's Point_ID
+	"""
+	import ee
+	widths = rwc(img, sites.union(1).geometry())
+	joined = ee.Join.inner().apply(widths, sites, ee.Filter.intersects(leftField = '.geo', rightField = '.geo', maxError = 1))
+	return(joined.map(lambda f: ee.Feature(f.get('primary')).set('Point_ID', ee.Feature(f.get('secondary')).get('Point_ID'))))
+
+def export_one_image(rwc, imgId, exportPrefix, OUTPUT_FOLDER, FORMAT, aoi = None):
+	"""build the width collection of one scene with an existing rwGenSR function and start its export task
+
+	aoi: geometry to clip the scene to, or the sites of a grouped POINT mode job (see point_widths)
+	"""
+	import ee
+	from functions_landsat import id2Img
+
+	img = id2Img(imgId)
+	if aoi is None:
+		widthOut = rwc(img)
+	elif isinstance(aoi, ee.FeatureCollection):
+		widthOut = point_widths(rwc, img, aoi)
+	else:
+		widthOut = rwc(img, aoi)
+
+	taskWidth = (ee.batch.Export.table.toDrive(
+		collection = widthOut,
+		description = exportPrefix,
+		folder = OUTPUT_FOLDER,
+		fileNamePrefix = exportPrefix,
+		fileFormat = FORMAT))
+	taskWidth.start()
+	return(taskWidth)
+
+# // approximate area (m2) of a full Landsat WRS-2 scene, 185 km x 180 km
+SCENE_AREA = 185000.0 * 180000.0
+
+def chunk_size(nScenes, MaxNActive, aoiArea = None, maxChunk = 100, maxChunkArea = 25 * SCENE_AREA):
+	"""number of scenes per export task in multi-scene mode
+
+	the scenes are spread over one round of the MaxNActive task slots, so that the task count rather than the per-task
+	overhead limits the batch as little as possible, but a task gets at most maxChunk scenes and at most maxChunkArea (m2)
+	to process, so that it stays within the time and memory limits of one export.
+	aoiArea: area (m2) processed per scene, e.g. (2 * BUFFER) ** 2 in POINT mode; None for full scenes
+	"""
+	import math
+	area = SCENE_AREA if aoiArea is None else min(aoiArea, SCENE_AREA)
+	size = int(math.ceil(nScenes / float(MaxNActive)))
+	return(max(1, min(size, maxChunk, int(maxChunkArea // area))))
+
+def chunk_jobs(jobs, size):
+	"""split jobs into consecutive chunks of at most size jobs
+	"""
+	return([jobs[i:(i + size)] for i in range(0, len(jobs), size)])
+
+def chunk_prefix(chunk):
+	"""export prefix of a chunk of jobs: its first scene, the parameter hash and the number of jobs
+	"""
+	imgId, exportPrefix, aoi, paramHash = chunk[0]
+	return('rwc_{}_{}_{}'.format(imgId, paramHash[:8], len(chunk)))
+
+def export_image_chunk(rwc, chunk, exportPrefix, OUTPUT_FOLDER, FORMAT):
+	"""map an existing rwGenSR function over the ImageCollection of a chunk of jobs, a list of (imgId, exportPrefix, aoi, paramHash),
+	and start one export task for the flattened widths
+
+	each width keeps the export prefix of its job in an 'export_prefix' column, so the table can be split back
+	into the files the one-task-per-scene mode would have written
+	"""
+	import ee
+	from functions_landsat import batch_id2Img
+
+	def tag(widths, prefix):
+		return(widths.map(lambda f: f.set('export_prefix', prefix)))
+
+	imgs = batch_id2Img([job[0] for job in chunk])
+	if isinstance(chunk[0][2], ee.FeatureCollection):
+		# // grouped POINT mode: each scene is run over and joined to its own sites
+		widthOut = ee.FeatureCollection([tag(point_widths(rwc, img, sites), jobPrefix)
+			for (img, (imgId, jobPrefix, sites, paramHash)) in zip(imgs, chunk)]).flatten()
+	else:
+		images = []
+		for (img, (imgId, jobPrefix, aoi, paramHash)) in zip(imgs, chunk):
+			img = img.set('rwc_export_prefix', jobPrefix)
+			if aoi is not None:
+				img = img.set('rwc_aoi', aoi)
+			images.append(img)
+
+		def widths(img):
+			# // a missing rwc_aoi is null, for which rwc falls back to the image geometry
+			return(tag(rwc(img, img.get('rwc_aoi')), img.get('rwc_export_prefix')))
+
+		widthOut = ee.ImageCollection(images).map(widths).flatten()
+
+	taskWidth = (ee.batch.Export.table.toDrive(
+		collection = widthOut,
+		description = exportPrefix,
+		folder = OUTPUT_FOLDER,
+		fileNamePrefix = exportPrefix,
+		fileFormat = FORMAT))
+	taskWidth.start()
+	return(taskWidth)
+
+def run_batch(jobs, rwc, OUTPUT_FOLDER, FORMAT, concurrency, tracker, ledger = None, chunkSize = 1, wait = True):
+	"""submit export tasks for jobs, a list of (imgId, exportPrefix, aoi, paramHash), from a pool of at most concurrency threads
+
+	ee is initialized and rwc built once by the caller; each job only builds its own graph and starts its task.
+	with chunkSize > 1, consecutive jobs are grouped into chunks of chunkSize scenes exported by one task each (see export_image_chunk).
+	a chunk that fails is split back into one job per scene, so a single bad scene does not use up the retry budget of the
+	others: chunk submissions are not counted as attempts, and jobs that already failed in the ledger are submitted on their own.
+	tracker (a TaskTracker) limits how many of the submitted tasks are active on the server at once;
+	if a JobLedger is given, every submission and failure is recorded in it, for each job of a chunk under the chunk's task.
+	with wait, returns only once none of the tracked tasks is active, so their final states reach the ledger
+	through the tracker's onFinish (e.g. JobLedger.finished) before the batch ends; the scenes of chunks that failed on the
+	server are then resubmitted one per task (without wait, they are in the next run).
+	"""
+	from concurrent.futures import ThreadPoolExecutor
+
+	# // (jobs, chunked) of each task
+	if chunkSize > 1:
+		failedBefore = [ledger is not None and (ledger.get(job[0], job[3]) or ('',))[0] == 'FAILED' for job in jobs]
+		fresh = [job for (job, failed) in zip(jobs, failedBefore) if not failed]
+		units = [(unit, True) for unit in chunk_jobs(fresh, chunkSize)]
+		units += [([job], False) for (job, failed) in zip(jobs, failedBefore) if failed]
+	else:
+		units = [([job], False) for job in jobs]
+	N = len(units)
+	counter = {'submitted': 0}
+	chunkTasks = {}
+	failedChunks = []
+
+	def submit(unit, chunked):
+		# // in multi-scene mode a last chunk of one scene is still exported with the export_prefix column
+		if chunked:
+			exportPrefix = chunk_prefix(unit)
+		else:
+			imgId, exportPrefix, aoi, paramHash = unit[0]
+		try:
+			if chunked:
+				task = export_image_chunk(rwc, unit, exportPrefix, OUTPUT_FOLDER, FORMAT)
+			else:
+				task = export_one_image(rwc, imgId, exportPrefix, OUTPUT_FOLDER, FORMAT, aoi)
+		except Exception as e:
+			tracker.release()
+			if ledger is not None:
+				for (imgId, jobPrefix, aoi, paramHash) in unit:
+					ledger.failed(imgId, paramHash, exportPrefix, e, not chunked)
+			print('failed to submit', exportPrefix, ':', e)
+			if chunked:
+				with tracker.lock:
+					failedChunks.append(unit)
+			return(None)
+		# // recorded before the task is tracked, so a poll that sees it finish always finds its ledger rows
+		if ledger is not None:
+			for (imgId, jobPrefix, aoi, paramHash) in unit:
+				ledger.submitted(imgId, paramHash, exportPrefix, task.id, not chunked)
+		with tracker.lock:
+			if chunked:
+				chunkTasks[task.id] = unit
+		tracker.add(task.id)
+		with tracker.lock:
+			counter['submitted'] += 1
+			print('submitted task ', counter['submitted'], ' of ', N)
+		return(task)
+
+	with ThreadPoolExecutor(max_workers = concurrency) as pool:
+		futures = []
+		for (unit, chunked) in units:
+			tracker.acquire()
+			futures.append(pool.submit(submit, unit, chunked))
+		for future in futures:
+			future.result()
+	if wait:
+		tracker.wait_all()
+		failedChunks += [unit for (taskId, unit) in chunkTasks.items() if tracker.finished.get(taskId) != 'COMPLETED']
+
+	retry = [job for unit in failedChunks for job in unit]
+	if retry:
+		print('resubmitting the', len(retry), 'scenes of', len(failedChunks), 'failed chunks one per task')
+		run_batch(retry, rwc, OUTPUT_FOLDER, FORMAT, concurrency, tracker, ledger, 1, wait)
 	return()
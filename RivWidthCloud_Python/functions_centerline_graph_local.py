@@ -0,0 +1,146 @@
+# /* centerline graph: junctions, end points and the pixel chains between them, built from a 1px skeleton */
+import math
+import numpy as np
+from collections import OrderedDict
+from scipy import ndimage
+from functions_local import Shift
+
+NEIGHBORS = [(dr, dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if (dr, dc) != (0, 0)]
+
+def CountNeighbors(cl1px):
+    # // number of centerline pixels in the 8-neighbourhood of each pixel
+    count = np.zeros(cl1px.shape, dtype = np.uint8)
+    for (dr, dc) in NEIGHBORS:
+        count += Shift(cl1px, dr, dc, False)
+    return(count)
+
+def CenterlineGraph(cl1px, scale):
+    """convert a 1px centerline into a graph
+
+    returns a dict with
+    - chainLabels: image of edge ids (0 where there is no chain pixel); chains are runs of pixels with one or two neighbors
+    - junctionLabels: image of node ids of junctions (pixels with three or more neighbors, adjacent ones merged), 0 elsewhere
+    - nodes: columns row, col, kind ('junction' or 'end') of every node; node id k is row k - 1
+    - edges: columns node0, node1 (-1 if the chain does not reach a second node), npixels and length (meters) of every chain;
+      edge id k is row k - 1
+    """
+    cl1px = cl1px.astype(bool)
+    count = CountNeighbors(cl1px)
+    junction = cl1px & (count >= 3)
+    chain = cl1px & ~junction
+    eightConnected = np.ones((3, 3), dtype = bool)
+
+    chainLabels, nChains = ndimage.label(chain, structure = eightConnected)
+    junctionLabels, nJunctions = ndimage.label(junction, structure = eightConnected)
+
+    ## nodes: one per junction cluster, then one per end pixel (one neighbor, or none for an isolated pixel)
+    centers = np.array(ndimage.center_of_mass(junction, junctionLabels, np.arange(1, nJunctions + 1))).reshape(-1, 2)
+    jr = np.round(centers[:, 0]).astype(np.int64)
+    jc = np.round(centers[:, 1]).astype(np.int64)
+    er, ec = np.nonzero(chain & (count <= 1))
+    nodeLabels = junctionLabels.copy()
+    nodeLabels[er, ec] = nJunctions + 1 + np.arange(len(er))
+    nodes = OrderedDict([
+        ('row', np.concatenate([jr, er])),
+        ('col', np.concatenate([jc, ec])),
+        ('kind', np.array(['junction'] * nJunctions + ['end'] * len(er), dtype = object))])
+
+    ## chain lengths from the steps between neighbouring chain pixels, plus the step onto each attached junction
+    length = np.zeros(nChains + 1)
+    for (dr, dc) in [(0, 1), (1, 0), (1, 1), (1, -1)]:
+        same = (chainLabels > 0) & (Shift(chainLabels, dr, dc, 0) == chainLabels)
+        np.add.at(length, chainLabels[same], math.hypot(dr, dc) * scale)
+
+    ## edge -> node attachments: end pixels of the chain itself and junctions touching it
+    pairs = set()
+    for k in range(len(er)):
+        pairs.add((chainLabels[er[k], ec[k]], nJunctions + 1 + k, 0.0))
+    for (dr, dc) in NEIGHBORS:
+        touching = (chainLabels > 0) & (Shift(junctionLabels, dr, dc, 0) > 0)
+        for (e, j) in set(zip(chainLabels[touching].tolist(), Shift(junctionLabels, dr, dc, 0)[touching].tolist())):
+            pairs.add((e, j, math.hypot(dr, dc) * scale))
+    node0 = np.full(nChains + 1, -1, dtype = np.int64)
+    node1 = np.full(nChains + 1, -1, dtype = np.int64)
+    for (e, n, step) in sorted(pairs):
+        if node0[e] < 0:
+            node0[e] = n
+        elif node1[e] < 0 and node0[e] != n:
+            node1[e] = n
+        else:
+            continue
+        length[e] += step
+
+    edges = OrderedDict([
+        ('node0', node0[1:]),
+        ('node1', node1[1:]),
+        ('npixels', np.bincount(chainLabels.ravel(), minlength = nChains + 1)[1:]),
+        ('length', length[1:])])
+
+    return({'chainLabels': chainLabels, 'junctionLabels': junctionLabels, 'nodeLabels': nodeLabels, 'nodes': nodes, 'edges': edges})
+
+def TrimFromEnds(graph, maxLength, scale):
+    """pixels of the chains within maxLength (meters, along the chain) of a free end, found by growing a front from all ends at once
+    """
+    chainLabels = graph['chainLabels']
+    nodes = graph['nodes']
+    ends = nodes['kind'] == 'end'
+    r = nodes['row'][ends]
+    c = nodes['col'][ends]
+    nr, nc = chainLabels.shape
+    dist = np.full(chainLabels.shape, np.inf)
+    dist[r, c] = 0
+
+    while len(r):
+        d = dist[r, c]
+        labels = chainLabels[r, c]
+        nextR, nextC = [], []
+        for (dr, dc) in NEIGHBORS:
+            rr = r + dr
+            cc = c + dc
+            inside = (rr >= 0) & (rr < nr) & (cc >= 0) & (cc < nc)
+            rr, cc, dd, ll = rr[inside], cc[inside], d[inside] + math.hypot(dr, dc) * scale, labels[inside]
+            # // stay on the same chain: the front stops at junctions
+            better = (chainLabels[rr, cc] == ll) & (dd < dist[rr, cc]) & (dd <= maxLength)
+            rr, cc, dd = rr[better], cc[better], dd[better]
+            np.minimum.at(dist, (rr, cc), dd)
+            nextR.append(rr)
+            nextC.append(cc)
+        front = np.unique(np.stack([np.concatenate(nextR), np.concatenate(nextC)]), axis = 1)
+        r, c = front[0], front[1]
+
+    return(np.isfinite(dist))
+
+def PruneCenterline(cl1px, maxBranchLengthToRemove, scale, graph = None):
+    """remove, in one pass over the graph, every pixel within maxBranchLengthToRemove (meters) of a free end along its chain:
+    spurs not longer than that disappear entirely, and junctions are kept, like the cumulativeCost pruning of CleanCenterline
+    """
+    if graph is None:
+        graph = CenterlineGraph(cl1px, scale)
+    edges = graph['edges']
+    kind = graph['nodes']['kind']
+    hasEnd = np.zeros(len(edges['length']), dtype = bool)
+    for key in ('node0', 'node1'):
+        attached = edges[key] > 0
+        hasEnd[attached] |= kind[edges[key][attached] - 1] == 'end'
+
+    ## short chains with a free end go as a whole; longer ones are trimmed from their ends
+    spur = np.concatenate([[False], hasEnd & (edges['length'] <= maxBranchLengthToRemove)])
+    remove = spur[graph['chainLabels']] | TrimFromEnds(graph, maxBranchLengthToRemove, scale)
+    return(cl1px.astype(bool) & ~remove)
+
+def CleanCenterlineGraph(cl1px, maxBranchLengthToRemove, rmCorners, scale):
+    """graph-based CleanCenterline:
+	1. remove branches
+	2. remove corners to insure 1px width (optional)
+    """
+    from functions_centerline_width_local import ExtractEndpoints, ExtractCorners
+
+    cl1Cleaned = PruneCenterline(cl1px, maxBranchLengthToRemove, scale)
+    ends = ExtractEndpoints(cl1Cleaned)
+    cl1Cleaned = cl1Cleaned & ~ends
+
+    if (rmCorners):
+        corners = ExtractCorners(cl1Cleaned)
+        cl1Cleaned = cl1Cleaned & ~corners
+
+    return cl1Cleaned
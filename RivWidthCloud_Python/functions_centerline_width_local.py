@@ -0,0 +1,488 @@
+# /* local (numpy) counterpart of functions_centerline_width */
+import math
+import numpy as np
+from collections import OrderedDict
+from scipy import ndimage
+from functions_local import Shift, PixelCoordinates, PixelIndices, XYToLonLat
+from functions_centerline_graph_local import CleanCenterlineGraph
+
+def Dilate(img, iterations):
+    # // equivalent of focal_max(1.5, 'circle', 'pixels', iterations) on a binary image
+    return(ndimage.binary_dilation(img, structure = np.ones((3, 3), dtype = bool), iterations = iterations))
+
+def hitOrMiss(image, se1, se2):
+    """perform hitOrMiss transform; pixels outside the array are ignored like masked pixels in reduceNeighborhood
+    """
+    e1 = np.ones(image.shape, dtype = bool)
+    e2 = np.ones(image.shape, dtype = bool)
+    for (r, c) in zip(*np.nonzero(se1)):
+        e1 &= Shift(image, r - 1, c - 1, True)
+    for (r, c) in zip(*np.nonzero(se2)):
+        e2 &= Shift(~image, r - 1, c - 1, True)
+    return e1 & e2
+
+def splitKernel(kernel, value):
+    """recalculate the kernel according to the given foreground value
+    """
+    return (np.array(kernel) == value).astype(np.uint8)
+
+def rotateKernel(kernel):
+    # // the same quarter turn (clockwise) as ee.Kernel.rotate(1)
+    return np.rot90(kernel, -1)
+
+def Skeletonize(image, iterations, method):
+    """perform skeletonization
+    """
+
+    kernels = SkeletonKernels(method)
+
+    result = image.astype(bool)
+
+    i = 0
+    while (i < iterations):
+        for (se1, se2) in kernels:
+            result = result & ~hitOrMiss(result, se1, se2)
+        i = i + 1
+
+    return result
+
+def SkeletonKernels(method):
+    """the 8 (hit, miss) kernel pairs in the order Skeletonize applies them
+    """
+    se1w = [[2, 2, 2], [0, 1, 0], [1, 1, 1]]
+    if (method == 2):
+        se1w = [[2, 2, 2], [0, 1, 0], [0, 1, 0]]
+    se2w = [[2, 2, 0], [2, 1, 1], [0, 1, 0]]
+    if (method == 2):
+        se2w = [[2, 2, 0], [2, 1, 1], [0, 1, 1]]
+
+    se11, se12 = splitKernel(se1w, 1), splitKernel(se1w, 2)
+    se21, se22 = splitKernel(se2w, 1), splitKernel(se2w, 2)
+    kernels = []
+    j = 0
+    while (j < 4):
+        kernels.append((se11, se12))
+        kernels.append((se21, se22))
+        se11, se12 = rotateKernel(se11), rotateKernel(se12)
+        se21, se22 = rotateKernel(se21), rotateKernel(se22)
+        j = j + 1
+    return kernels
+
+def PackBits(mask):
+    """pack a boolean image into uint64 words along rows, bit k of word w holding column 64 * w + k; padding bits are 0
+    """
+    nr, nc = mask.shape
+    nw = (nc + 63) // 64
+    padded = np.zeros((nr, nw * 64), dtype = bool)
+    padded[:, :nc] = mask
+    return np.packbits(padded, axis = 1, bitorder = 'little').view('<u8')
+
+def UnpackBits(words, nc):
+    return np.unpackbits(words.view(np.uint8), axis = 1, bitorder = 'little')[:, :nc].astype(bool)
+
+def ShiftBits(words, dr, dc):
+    """out[r, c] = in[r + dr, c + dc] for |dr|, |dc| <= 1 on packed rows, shifting in set bits (ignored pixels) from outside
+    """
+    ones = np.uint64(0xFFFFFFFFFFFFFFFF)
+    if dr != 0:
+        words = Shift(words, dr, 0, ones)
+    if dc == 1:
+        following = np.concatenate([words[:, 1:], np.full((words.shape[0], 1), ones)], axis = 1)
+        words = (words >> np.uint64(1)) | (following << np.uint64(63))
+    elif dc == -1:
+        preceding = np.concatenate([np.full((words.shape[0], 1), ones), words[:, :-1]], axis = 1)
+        words = (words << np.uint64(1)) | (preceding >> np.uint64(63))
+    return words
+
+def SkeletonizeBits(image, iterations = None, method = 1):
+    """bit-parallel Skeletonize: 64 pixels per word, all 8 hit-or-miss kernels evaluated with shifts and ANDs
+
+    gives the same result as Skeletonize(image, iterations, method); with iterations = None it thins until
+    a full pass over the 8 kernels removes nothing
+    """
+    nr, nc = image.shape
+    inside = PackBits(np.ones((nr, nc), dtype = bool))
+    outside = ~inside
+    fg = PackBits(image.astype(bool))
+    offsets = [[(r - 1, c - 1) for (r, c) in zip(*np.nonzero(se))] for pair in SkeletonKernels(method) for se in pair]
+    offsets = [(offsets[k], offsets[k + 1]) for k in range(0, len(offsets), 2)]
+
+    i = 0
+    while (iterations is None or i < iterations):
+        changed = False
+        for (hits, misses) in offsets:
+            # // pixels outside the image count as both foreground and background, i.e. they are ignored
+            fgIgnored = fg | outside
+            bgIgnored = ~fg
+            match = inside.copy()
+            for (dr, dc) in hits:
+                match &= ShiftBits(fgIgnored, dr, dc)
+            for (dr, dc) in misses:
+                match &= ShiftBits(bgIgnored, dr, dc)
+            match &= fg
+            if match.any():
+                fg &= ~match
+                changed = True
+        i = i + 1
+        if not changed:
+            break
+
+    return UnpackBits(fg, nc)
+
+def CalcDistanceMap(img, neighborhoodSize, scale):
+    # // assign each river pixel with the distance (in meter) between itself and the closest non-river pixel
+    return(CalcDistanceMapExact(img, scale, neighborhoodSize))
+
+def CalcDistanceMapExact(img, scale, maxDistance = None):
+    """exact distance map (meters) from the Euclidean distance transform of the bank outline
+
+    same outline and mask as CalcDistanceMap; distances beyond maxDistance (pixels) are masked only if a cap is given,
+    so the interior of very wide rivers and lakes is kept
+    """
+    imgD2 = Dilate(img, 2)
+    imgD1 = Dilate(img, 1)
+    outline = imgD2 & ~imgD1
+
+    if outline.any():
+        dpixel = ndimage.distance_transform_edt(~outline)
+    else:
+        dpixel = np.full(outline.shape, np.inf)
+    valid = imgD2 & np.isfinite(dpixel)
+    if maxDistance is not None:
+        valid &= dpixel <= maxDistance
+    DM = np.where(valid, dpixel * scale, np.nan)
+
+    return(DM)
+
+def CalcGradientMap(image, gradMethod, scale):
+    ## Calculate the gradient
+    if (gradMethod == 1): # numpy gradient
+        dy, dx = np.gradient(image)
+        g = np.sqrt(dx * dx + dy * dy)
+
+    if (gradMethod == 2): # Gena's method
+        k_dx = np.array([[ 1.0/8, 0.0, -1.0/8], [ 2.0/8, 0.0, -2.0/8], [ 1.0/8,  0.0, -1.0/8]])
+        k_dy = np.array([[ -1.0/8, -2.0/8, -1.0/8], [ 0.0, 0.0, 0.0], [ 1.0/8, 2.0/8, 1.0/8]])
+        dx = ndimage.correlate(image, k_dx, mode = 'constant', cval = np.nan)
+        dy = ndimage.correlate(image, k_dy, mode = 'constant', cval = np.nan)
+        g = np.sqrt((dx * dx + dy * dy) / (scale * scale))
+
+    if (gradMethod == 3): # RivWidth method
+        k_dx = np.array([[-0.5, 0.0, 0.5]])
+        k_dy = np.array([[0.5], [0.0], [-0.5]])
+        dx = ndimage.correlate(image, k_dx, mode = 'constant', cval = np.nan)
+        dy = ndimage.correlate(image, k_dy, mode = 'constant', cval = np.nan)
+        g = (dx * dx + dy * dy) / (scale * scale)
+
+    return(g)
+
+def CalcOnePixelWidthCenterline(img, GM, hGrad):
+    # /***
+    # calculate the 1px centerline from:
+    # 1. distance transform of the river banks
+    # 2. gradient of the distance transform, mask areas where gradient greater than a threshold hGrad
+    # 3. apply skeletonization twice to get a 1px centerline
+    # thresholding gradient map inspired by Pavelsky and Smith., 2008
+    # ***/
+
+    imgD2 = Dilate(img, 2)
+    with np.errstate(invalid = 'ignore'):
+        cl = imgD2 & (GM <= hGrad) & (img == 1)
+    # // apply skeletonization twice
+    cl1px = SkeletonizeBits(cl, 2, 1)
+    return(cl1px)
+
+def ExtractEndpoints(CL1px):
+    """calculate end points in the one pixel centerline
+    """
+
+    se1w = [[0, 0, 0], [2, 1, 2], [2, 2, 2]]
+
+    se11 = splitKernel(se1w, 1)
+    se12 = splitKernel(se1w, 2)
+
+    endpoints = np.zeros(CL1px.shape, dtype = bool)
+
+    i = 0
+    while (i<4): # rotate kernels
+        endpoints |= hitOrMiss(CL1px, se11, se12)
+        se11 = rotateKernel(se11)
+        se12 = rotateKernel(se12)
+        i = i + 1
+    return endpoints
+
+def ExtractCorners(CL1px):
+    """calculate corners in the one pixel centerline
+    """
+
+    se1w = [[2, 2, 0], [2, 1, 1], [0, 1, 0]]
+
+    se11 = splitKernel(se1w, 1)
+    se12 = splitKernel(se1w, 2)
+
+    result = CL1px
+    # // the for loop removes the identified corners from the imput image
+
+    i = 0
+    while(i < 4): # rotate kernels
+
+        result = result & ~hitOrMiss(result, se11, se12)
+
+        se11 = rotateKernel(se11)
+        se12 = rotateKernel(se12)
+
+        i = i + 1
+
+    cornerPoints = CL1px & ~result
+    return cornerPoints
+
+def CumulativeCost(allowed, source, maxDistance, scale):
+    """path length (meters) from source through the allowed pixels (8-connectivity); inf where farther than maxDistance or unreachable
+    """
+    cost = np.where(source & allowed, 0.0, np.inf)
+    steps = [(dr, dc, math.hypot(dr, dc) * scale) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if (dr, dc) != (0, 0)]
+    changed = True
+    while changed:
+        previous = cost
+        for (dr, dc, d) in steps:
+            cost = np.minimum(cost, Shift(previous, dr, dc, np.inf) + d)
+        cost[~allowed | (cost > maxDistance)] = np.inf
+        changed = not np.array_equal(cost, previous)
+    return(cost)
+
+def CleanCenterline(cl1px, maxBranchLengthToRemove, rmCorners, scale):
+    """clean the 1px centerline:
+	1. remove branches
+	2. remove corners to insure 1px width (optional)
+    """
+
+    ## find the number of connecting pixels (8-connectivity)
+    nearbyPoints = ndimage.correlate(cl1px.astype(np.uint8), np.ones((3, 3), dtype = np.uint8), mode = 'constant', cval = 0)
+
+	## define ends
+    endsByNeighbors = cl1px & (nearbyPoints <= 2)
+
+	## define joint points
+    joints = cl1px & (nearbyPoints >= 4)
+
+    costMap = CumulativeCost(cl1px & ~joints, endsByNeighbors, maxBranchLengthToRemove, scale)
+
+    branchMask = np.isfinite(costMap)
+    cl1Cleaned = cl1px & ~branchMask # mask short branches;
+    ends = ExtractEndpoints(cl1Cleaned)
+    cl1Cleaned = cl1Cleaned & ~ends
+
+    if (rmCorners):
+        corners = ExtractCorners(cl1Cleaned)
+        cl1Cleaned = cl1Cleaned & ~corners
+
+    return cl1Cleaned
+
+W3 = np.array([
+    [135.0, 126.9, 116.6, 104.0, 90.0, 76.0, 63.4, 53.1, 45.0],
+    [143.1, 0.0,	0.0,	0.0,	0.0,	0.0,	0.0,	0.0, 36.9],
+    [153.4, 0.0,	0.0,	0.0,	0.0,	0.0,	0.0,	0.0, 26.6],
+    [166.0, 0.0,	0.0,	0.0,	0.0,	0.0,	0.0,	0.0, 14.0],
+    [180.0, 0.0,	0.0,	0.0,	0.0,	0.0,	0.0,	0.0, 1e-5],
+    [194.0, 0.0,	0.0,	0.0,	0.0,	0.0,	0.0,	0.0, 346.0],
+    [206.6, 0.0,	0.0,	0.0,	0.0,	0.0,	0.0,	0.0, 333.4],
+    [216.9, 0.0,	0.0,	0.0,	0.0,	0.0,	0.0,	0.0, 323.1],
+    [225.0, 233.1,  243.4,  256.0,  270.0,  284.0,  296.6,  306.9, 315.0]])
+
+def CalculateAngle(clCleaned):
+    """calculate the orthogonal direction of each pixel of the centerline
+    """
+
+    cl = clCleaned.astype(np.float64)
+    clAngleSum = ndimage.correlate(cl, W3, mode = 'constant', cval = 0)
+    clAngleCount = ndimage.correlate(cl, (W3 != 0).astype(np.float64), mode = 'constant', cval = 0)
+
+	## mask calculating when there are more than two inputs into the angle calculation
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        clAngleNorm = np.where(clCleaned & (clAngleCount <= 2), clAngleSum / clAngleCount, np.nan)
+
+	## if only one input into the angle calculation, rotate it by 90 degrees to get the orthogonal
+    clAngleNorm = np.where(clAngleCount == 1, clAngleNorm + 90, clAngleNorm)
+
+    return clAngleNorm
+
+## ring offsets (row, col) of W3 and their angle weights
+W3_RING = [(r - 4, c - 4, W3[r, c]) for r in range(9) for c in range(9) if W3[r, c] != 0]
+
+def CalculateAnglePoints(rows, cols, shape):
+    """CalculateAngle for a list of centerline pixels: only the ring neighbours are looked up, in a sorted linear index
+    of the centerline pixels, so the work is proportional to the number of centerline pixels instead of 81 taps per image pixel
+    """
+    nr, nc = shape
+    rows = np.asarray(rows, dtype = np.int64)
+    cols = np.asarray(cols, dtype = np.int64)
+    index = np.sort(rows * nc + cols)
+    clAngleSum = np.zeros(len(rows))
+    clAngleCount = np.zeros(len(rows))
+    for (dr, dc, w) in W3_RING:
+        r = rows + dr
+        c = cols + dc
+        linear = r * nc + c
+        pos = np.minimum(np.searchsorted(index, linear), len(index) - 1)
+        found = (r >= 0) & (r < nr) & (c >= 0) & (c < nc) & (index[pos] == linear)
+        clAngleSum += found * w
+        clAngleCount += found
+
+	## mask calculating when there are more than two inputs into the angle calculation
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        clAngleNorm = np.where(clAngleCount <= 2, clAngleSum / clAngleCount, np.nan)
+
+	## if only one input into the angle calculation, rotate it by 90 degrees to get the orthogonal
+    clAngleNorm = np.where(clAngleCount == 1, clAngleNorm + 90, clAngleNorm)
+
+    return clAngleNorm
+
+def XsectionStats(xc, yc, angle, toBankDistance, segmentInfo, endInfo, footprint, transform, scale):
+    """measure all cross sections at once
+
+    xc, yc: centerline points (crs units); angle: orthogonal direction (degrees); toBankDistance: distance map (meters).
+    returns the columns GetWidth produces from the two reduceRegions calls: the mean of each segmentInfo band along the
+    cross section (pixels it passes through) and any/count of endInfo within 30 m of the two ends
+    """
+    nr, nc = footprint.shape
+    npts = len(xc)
+    orthRad = angle / 180 * math.pi
+    width = toBankDistance * 1.5
+    cosRad = width * np.cos(orthRad)
+    sinRad = width * np.sin(orthRad)
+    p1x, p1y = xc + cosRad, yc + sinRad
+    p2x, p2y = xc - cosRad, yc - sinRad
+
+    ## calculate the flags at the xsection line end points
+    radius = int(math.ceil(30.0 / scale))
+    dr, dc = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    inBuffer = np.hypot(dr, dc) * scale <= 30
+    dr = dr[inBuffer]
+    dc = dc[inBuffer]
+    endR, endC = PixelIndices(transform, np.concatenate([p1x, p2x]), np.concatenate([p1y, p2y]))
+    endR = np.floor(endR).astype(np.int64)[:, None] + dr[None, :]
+    endC = np.floor(endC).astype(np.int64)[:, None] + dc[None, :]
+    inside = (endR >= 0) & (endR < nr) & (endC >= 0) & (endC < nc)
+    endR = np.where(inside, endR, 0)
+    endC = np.where(inside, endC, 0)
+    valid = inside & footprint[endR, endC]
+    nonZero = valid & (endInfo[endR, endC] != 0)
+    count = valid[:npts].sum(axis = 1) + valid[npts:].sum(axis = 1)
+    anyNonZero = nonZero[:npts].any(axis = 1) | nonZero[npts:].any(axis = 1)
+
+    ## calculate the width of the river and other flags along the xsection lines:
+    ## every line is sampled at a quarter pixel, all lines flattened into one ragged array
+    n = np.ceil(2 * width / scale * 4).astype(np.int64) + 1
+    line = np.repeat(np.arange(npts), n)
+    first = np.cumsum(n) - n
+    j = np.arange(n.sum()) - np.repeat(first, n)
+    step = np.where(n > 1, 1.0 / np.maximum(n - 1, 1), 0.0)
+    t = j * step[line]
+    t[(j == n[line] - 1) & (n[line] > 1)] = 1.0
+    r, c = PixelIndices(transform, p1x[line] + (p2x - p1x)[line] * t, p1y[line] + (p2y - p1y)[line] * t)
+    r = np.floor(r).astype(np.int64)
+    c = np.floor(c).astype(np.int64)
+    keep = (r >= 0) & (r < nr) & (c >= 0) & (c < nc)
+    line, r, c = line[keep], r[keep], c[keep]
+    keep = footprint[r, c]
+    line, r, c = line[keep], r[keep], c[keep]
+    ## each pixel counts once per line
+    key = np.unique(line * (nr * nc) + r * nc + c)
+    line = key // (nr * nc)
+    pix = key % (nr * nc)
+
+    columns = OrderedDict([('any', anyNonZero.astype(np.float64)), ('count', count.astype(np.float64))])
+    for name in segmentInfo:
+        values = segmentInfo[name].ravel()[pix].astype(np.float64)
+        finite = np.isfinite(values)
+        total = np.bincount(line[finite], weights = values[finite], minlength = npts)
+        number = np.bincount(line[finite], minlength = npts)
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            columns[name] = np.where(number > 0, total / number, np.nan)
+    return(columns)
+
+def GetWidth(clAngleNorm, segmentInfo, endInfo, DM, crs, transform, footprint, scale, sceneID, note, lonLat = None):
+    """calculate the width of the river at each centerline pixel, measured according to the orthgonal direction of the river
+    lonLat: optional precomputed (lon, lat) grids of the pixel centers, shared by scenes on the same grid
+    """
+
+    ## convert centerline image to a list of points
+    rows, cols = np.nonzero(np.isfinite(clAngleNorm) & np.isfinite(DM))
+    xs, ys = PixelCoordinates(transform, rows, cols)
+    if lonLat is None:
+        lons, lats = XYToLonLat(xs, ys, crs)
+    else:
+        lons, lats = lonLat[0][rows, cols], lonLat[1][rows, cols]
+    angle = clAngleNorm[rows, cols]
+    toBankDistance = DM[rows, cols]
+
+    stats = XsectionStats(xs, ys, angle, toBankDistance, segmentInfo, endInfo, footprint, transform, scale)
+
+    npts = len(rows)
+    columns = OrderedDict([
+        ('xc', xs),
+        ('yc', ys),
+        ('longitude', np.asarray(lons, dtype = np.float64)),
+        ('latitude', np.asarray(lats, dtype = np.float64)),
+        ('orthogonalDirection', angle / 180 * math.pi),
+        ('MLength', toBankDistance * 1.5 * 2),
+        ('crs', np.full(npts, crs, dtype = object)),
+        ('image_id', np.full(npts, sceneID, dtype = object)),
+        ('note', np.full(npts, note, dtype = object))])
+    columns.update(stats)
+    return columns
+
+def CalculateCenterline(imgIn, distanceCap = None):
+
+    scale = imgIn.get('scale')
+    riverMask = imgIn.band('riverMask') == 1
+
+    distM = CalcDistanceMapExact(riverMask, scale, distanceCap)
+    gradM = CalcGradientMap(distM, 2, scale)
+    cl1 = CalcOnePixelWidthCenterline(riverMask, gradM, 0.9)
+    # // graph-based pruning gives the same result as CleanCenterline without the cumulativeCost passes
+    cl1Cleaned1 = CleanCenterlineGraph(cl1, 300, True, scale)
+    cl1px = CleanCenterlineGraph(cl1Cleaned1, 300, False, scale)
+
+    imgOut = (imgIn.addBands({
+        'cleanedCL': cl1px,
+        'rawCL': cl1,
+        'gradientMap': gradM,
+        'distanceMap': distM}))
+
+    return(imgOut)
+
+def CalculateOrthAngle(imgIn):
+    cl1px = imgIn.band('cleanedCL')
+    rows, cols = np.nonzero(cl1px)
+    angle = np.full(cl1px.shape, np.nan)
+    if len(rows):
+        angle[rows, cols] = CalculateAnglePoints(rows, cols, cl1px.shape)
+    imgOut = imgIn.addBands({'orthDegree': angle})
+    return(imgOut)
+
+def prepExport(f):
+    f['width'] = f['MLength'] * f['channelMask']
+    f['endsInWater'] = (f['any'] == 1).astype(np.uint8)
+    f['endsOverEdge'] = (f['count'] < 2).astype(np.uint8)
+
+    fOut = OrderedDict((k, v) for k, v in f.items() if k not in ['any', 'count', 'MLength', 'xc', 'yc', 'channelMask'])
+    return(fOut)
+
+def CalculateWidth(imgIn, lonLat = None):
+    crs = imgIn.get('crs')
+    scale = imgIn.get('scale')
+    imgId = imgIn.get('image_id')
+    angle = imgIn.band('orthDegree')
+    infoEnds = imgIn.band('riverMask')
+    infoExport = OrderedDict([('channelMask', imgIn.band('channelMask'))])
+    infoExport.update(imgIn.select('^flag.*').bands)
+    if 'dem' in imgIn.bands:
+        infoExport['flag_elevation'] = imgIn.band('dem')
+    else:
+        infoExport['flag_elevation'] = np.full(imgIn.shape, np.nan)
+    dm = imgIn.band('distanceMap')
+
+    widths = prepExport(GetWidth(angle, infoExport, infoEnds, dm, crs, imgIn.transform, imgIn.footprint, scale, imgId, '', lonLat))
+
+    return(widths)
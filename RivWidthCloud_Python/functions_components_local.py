@@ -0,0 +1,40 @@
+# /* connected components of binary masks (scipy.ndimage.label) with exact component sizes, 4- or 8-connectivity */
+import numpy as np
+from scipy import ndimage
+
+def Structure(connectivity):
+    """ndimage.label structuring element of 4- or 8-connectivity
+    """
+    if connectivity not in (4, 8):
+        raise ValueError('connectivity must be 4 or 8')
+    return(ndimage.generate_binary_structure(2, 1 if connectivity == 4 else 2))
+
+def Label(mask, connectivity = 8):
+    """(labels, n) of the components of mask, numbered 1..n in raster order of their first pixel
+    """
+    return(ndimage.label(np.asarray(mask, dtype = bool), structure = Structure(connectivity)))
+
+def ComponentSizes(mask, connectivity = 8):
+    """image with the exact pixel count of the component each pixel of mask belongs to (0 outside mask), no size cap
+    """
+    labels, n = Label(mask, connectivity)
+    sizes = np.bincount(labels.ravel(), minlength = n + 1)
+    sizes[0] = 0
+    return(sizes[labels])
+
+def ConnectedToSeeds(mask, seeds, connectivity = 8):
+    """pixels of mask whose component contains at least one seed pixel
+    """
+    labels, n = Label(mask, connectivity)
+    connected = np.zeros(n + 1, dtype = bool)
+    connected[labels[np.asarray(seeds, dtype = bool)]] = True
+    connected[0] = False
+    return(connected[labels])
+
+def SmallComponents(mask, maxSize, connectivity = 8):
+    """pixels of mask whose component has fewer than maxSize pixels (exact, unlike the 1024-capped connectedPixelCount)
+    """
+    labels, n = Label(mask, connectivity)
+    small = np.bincount(labels.ravel(), minlength = n + 1) < maxSize
+    small[0] = False
+    return(small[labels])
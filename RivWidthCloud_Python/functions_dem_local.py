@@ -0,0 +1,134 @@
+# /* local DEM (MERIT) provider: memory-mapped tiles with LRU caches shared by the hill shadow and elevation flags */
+import os
+import math
+import numpy as np
+from functions_local import PixelLonLat, LRUCache
+
+class DemProvider(object):
+    """DEM tiles of tileDegrees x tileDegrees on a regular lon/lat grid, stored as .npy arrays (row 0 at the north edge)
+    named after their south-west corner like the MERIT tiles (e.g. n30w090_dem.npy for 30-35N, 90-85W)
+
+    tiles are memory-mapped and kept in an LRU cache keyed by tile index; hill shadow is computed per tile and
+    memoized by (tile, sun azimuth, sun zenith) with the angles rounded to sunRounding degrees, so scenes of one
+    path/row reuse both the elevations and the terrain work
+    """
+
+    def __init__(self, directory, tileDegrees = 5, pattern = '{ns}{lat:02d}{ew}{lon:03d}_dem.npy', maxTiles = 16, maxShadowTiles = 16, sunRounding = 1.0):
+        self.directory = directory
+        self.tileDegrees = tileDegrees
+        self.pattern = pattern
+        self.maxTiles = maxTiles
+        self.maxShadowTiles = maxShadowTiles
+        self.sunRounding = sunRounding
+        self.tiles = LRUCache(maxTiles)
+        self.shadows = LRUCache(maxShadowTiles)
+
+    def __getstate__(self):
+        # // the caches are per process; they are not sent along to pool workers
+        state = dict(self.__dict__)
+        state['tiles'] = LRUCache(self.maxTiles)
+        state['shadows'] = LRUCache(self.maxShadowTiles)
+        return(state)
+
+    def TileIndex(self, lon, lat):
+        ix = np.floor((np.asarray(lon) + 180.0) / self.tileDegrees).astype(np.int64)
+        iy = np.floor((90.0 - np.asarray(lat)) / self.tileDegrees).astype(np.int64)
+        return(ix, iy)
+
+    def TilePath(self, ix, iy):
+        lon = int(round(ix * self.tileDegrees - 180))
+        lat = int(round(90 - (iy + 1) * self.tileDegrees))
+        name = self.pattern.format(ns = 'n' if lat >= 0 else 's', lat = abs(lat), ew = 'e' if lon >= 0 else 'w', lon = abs(lon))
+        return(os.path.join(self.directory, name))
+
+    def Tile(self, ix, iy):
+        """memory-mapped tile, or None where there is no tile (e.g. open ocean)
+        """
+        ix = ix % int(round(360 / self.tileDegrees))
+        key = (ix, iy)
+        tile = self.tiles.get(key)
+        if tile is None:
+            path = self.TilePath(ix, iy)
+            tile = np.load(path, mmap_mode = 'r') if os.path.exists(path) else False
+            self.tiles.put(key, tile)
+        return(tile if tile is not False else None)
+
+    def Mosaic(self, ix, iy, margin, n, xMargin = None):
+        """tile (ix, iy) of n x n pixels with margin rows (and xMargin columns, margin if not given) from its neighbours;
+        NaN where there is no data
+        """
+        xMargin = margin if xMargin is None else xMargin
+        out = np.full((n + 2 * margin, n + 2 * xMargin), np.nan, dtype = np.float32)
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                tile = self.Tile(ix + dx, iy + dy)
+                if tile is None:
+                    continue
+                # // rows and columns of the neighbour that fall inside the mosaic
+                rs = slice(n - margin, n) if dy == -1 else (slice(0, n) if dy == 0 else slice(0, margin))
+                cs = slice(n - xMargin, n) if dx == -1 else (slice(0, n) if dx == 0 else slice(0, xMargin))
+                ro = 0 if dy == -1 else (margin if dy == 0 else margin + n)
+                co = 0 if dx == -1 else (xMargin if dx == 0 else xMargin + n)
+                block = tile[rs, cs]
+                out[ro:ro + block.shape[0], co:co + block.shape[1]] = block
+        return(out)
+
+    def Sample(self, lon, lat, values = None):
+        """nearest-pixel elevation at lon, lat (or of the given per-tile arrays, e.g. hill shadow); NaN where there is no tile
+        """
+        lon = np.asarray(lon, dtype = np.float64)
+        lat = np.asarray(lat, dtype = np.float64)
+        ix, iy = self.TileIndex(lon, lat)
+        out = np.full(lon.shape, np.nan)
+        for key in set(zip(ix.ravel().tolist(), iy.ravel().tolist())):
+            tile = self.Tile(*key) if values is None else values(*key)
+            if tile is None:
+                continue
+            n = tile.shape[0]
+            sel = (ix == key[0]) & (iy == key[1])
+            col = np.floor((lon[sel] + 180.0 - key[0] * self.tileDegrees) / self.tileDegrees * n).astype(np.int64)
+            row = np.floor(((90.0 - lat[sel]) - key[1] * self.tileDegrees) / self.tileDegrees * n).astype(np.int64)
+            out[sel] = tile[np.clip(row, 0, n - 1), np.clip(col, 0, n - 1)]
+        return(out)
+
+    def HillShadowTile(self, ix, iy, azimuth, zenith, maxDistance = 9000):
+        """memoized hill shadow (1 lit, 0 shadow) of one tile, computed with maxDistance of terrain from the neighbouring tiles
+        """
+        from functions_landsat_local import HillShadow
+
+        az = round(azimuth / self.sunRounding) * self.sunRounding
+        zen = round(zenith / self.sunRounding) * self.sunRounding
+        key = (ix, iy, az, zen)
+        shadow = self.shadows.get(key)
+        if shadow is None:
+            tile = self.Tile(ix, iy)
+            if tile is None:
+                return(None)
+            n = tile.shape[0]
+            # // pixel size (meters) along a meridian, as in the 90 m EPSG:4326 reprojection of the server version;
+            # // along a parallel it shrinks with cos(latitude) of each row
+            scale = self.tileDegrees / n * 111320.0
+            margin = min(int(math.ceil(maxDistance / scale)), n)
+            rowLat = 90.0 - iy * self.tileDegrees - (np.arange(-margin, n + margin) + 0.5) * self.tileDegrees / n
+            xScale = np.maximum(scale * np.cos(np.radians(rowLat)), 1e-3 * scale)
+            # // enough columns of the east and west neighbours for the narrowest pixels of the tile
+            xMargin = min(int(math.ceil(maxDistance / np.min(xScale[margin:margin + n]))), n)
+            dem = self.Mosaic(ix, iy, margin, n, xMargin)
+            shadow = HillShadow(dem, az, zen, scale, maxDistance, xScale)[margin:margin + n, xMargin:xMargin + n]
+            self.shadows.put(key, shadow)
+        return(shadow)
+
+def DemOnGrid(provider, shape, transform, crs, lonLat = None):
+    """elevation at the center of each pixel of a grid
+    lonLat: optional (lon, lat) grids of the pixel centers (see functions_local.PixelLonLat), reprojected here if not given
+    """
+    lon, lat = PixelLonLat(shape, transform, crs) if lonLat is None else lonLat
+    return(provider.Sample(lon, lat))
+
+def HillShadowOnGrid(provider, shape, transform, crs, azimuth, zenith, lonLat = None):
+    """hill shadow (1 lit, 0 shadow) at the center of each pixel of a grid, from the memoized per-tile hill shadow
+    lonLat: as in DemOnGrid
+    """
+    lon, lat = PixelLonLat(shape, transform, crs) if lonLat is None else lonLat
+    shadow = provider.Sample(lon, lat, lambda ix, iy: provider.HillShadowTile(ix, iy, azimuth, zenith))
+    return(np.where(np.isnan(shadow), 1, shadow).astype(np.uint8))
@@ -0,0 +1,226 @@
+# /* local GRWL access: centerline segments in a packed STR-tree, rasterized per scene grid and cached per WRS-2 tile */
+import math
+import struct
+import numpy as np
+from functions_local import LRUCache, LonLatToXY, _IsLonLat, PixelCoordinates, PixelIndices, XYToLonLat
+
+def _ReadWkb(blob, offset = 0):
+    """(list of (N, 2) lon, lat arrays, offset after the geometry) of a WKB LineString or MultiLineString (ISO or EWKB Z/M)
+    """
+    order = '<' if blob[offset] == 1 else '>'
+    gtype = struct.unpack_from(order + 'I', blob, offset + 1)[0]
+    offset = offset + 5
+    ndims = 2
+    if gtype & 0x20000000:
+        # // EWKB srid
+        offset = offset + 4
+    if gtype & 0x80000000:
+        ndims += 1
+    if gtype & 0x40000000:
+        ndims += 1
+    gtype = gtype & 0x0FFFFFFF
+    if gtype >= 1000:
+        ndims = 2 + {1: 1, 2: 1, 3: 2}[gtype // 1000]
+        gtype = gtype % 1000
+    if gtype == 2:
+        n = struct.unpack_from(order + 'I', blob, offset)[0]
+        coords = np.frombuffer(blob, dtype = order + 'f8', count = n * ndims, offset = offset + 4).reshape(n, ndims)
+        return([coords[:, :2].astype(np.float64)], offset + 4 + 8 * n * ndims)
+    elif gtype == 5:
+        n = struct.unpack_from(order + 'I', blob, offset)[0]
+        offset = offset + 4
+        lines = []
+        for k in range(n):
+            part, offset = _ReadWkb(blob, offset)
+            lines.extend(part)
+        return(lines, offset)
+    raise ValueError('unsupported WKB geometry type {}'.format(gtype))
+
+def _GpkgWkb(blob):
+    # // strip the GeoPackage binary header (magic, version, flags, srs id, envelope) in front of the WKB
+    flags = blob[3]
+    envelope = {0: 0, 1: 32, 2: 48, 3: 48, 4: 64}[(flags >> 1) & 7]
+    return(bytes(blob[8 + envelope:]))
+
+def ReadGrwl(path, layer = None, geometryColumn = None):
+    """GRWL centerlines, as a list of (N, 2) lon, lat arrays, from a GeoPackage (.gpkg) or a GeoParquet (.parquet) file
+    """
+    lines = []
+    if path.endswith('.gpkg'):
+        import sqlite3
+        con = sqlite3.connect(path)
+        try:
+            query = 'SELECT table_name, column_name FROM gpkg_geometry_columns'
+            tables = con.execute(query).fetchall()
+            if layer is not None:
+                tables = [t for t in tables if t[0] == layer]
+            table, column = tables[0]
+            for (blob,) in con.execute('SELECT "{}" FROM "{}"'.format(geometryColumn or column, table)):
+                if blob is not None:
+                    lines.extend(_ReadWkb(_GpkgWkb(blob))[0])
+        finally:
+            con.close()
+    else:
+        import pyarrow.parquet as pq
+        column = geometryColumn or 'geometry'
+        for blob in pq.read_table(path, columns = [column]).column(column).to_pylist():
+            if blob is not None:
+                lines.extend(_ReadWkb(blob)[0])
+    return(lines)
+
+def WrsTile(image):
+    """(path, row) of a Landsat scene from its WRS_PATH/WRS_ROW properties or its LANDSAT_ID; None if unknown
+    """
+    path, row = image.get('WRS_PATH'), image.get('WRS_ROW')
+    if path is not None and row is not None:
+        return((int(path), int(row)))
+    parts = str(image.get('LANDSAT_ID') or '').split('_')
+    if len(parts) > 2 and len(parts[2]) == 6 and parts[2].isdigit():
+        return((int(parts[2][:3]), int(parts[2][3:])))
+    return(None)
+
+class GrwlIndex(object):
+    """GRWL centerline segments packed into a Sort-Tile-Recursive tree: segment bounding boxes are sorted into
+    vertical slices and then by latitude, grouped nodeCapacity at a time into leaves, and leaves into parents the same way,
+    so a bounding-box query visits O(log n) levels and only the nodes overlapping the box
+
+    the rasterized centerlines are kept in an LRU cache keyed by WRS-2 tile, crs and pixel size: the scenes of one
+    path/row are windows of one painting as long as their grids are whole pixels apart, and a scene reaching beyond it
+    repaints the union of the two grids once
+    """
+
+    def __init__(self, lines, nodeCapacity = 16, maxCached = 32):
+        x0, y0, x1, y1 = [], [], [], []
+        for line in lines:
+            line = np.asarray(line, dtype = np.float64)
+            if line.shape[0] == 1:
+                line = np.concatenate([line, line])
+            x0.append(line[:-1, 0])
+            y0.append(line[:-1, 1])
+            x1.append(line[1:, 0])
+            y1.append(line[1:, 1])
+        seg = np.stack([np.concatenate(v) if v else np.zeros(0) for v in (x0, y0, x1, y1)], 1)
+        self.nodeCapacity = nodeCapacity
+        self.maxCached = maxCached
+        self.cache = LRUCache(maxCached)
+
+        boxes = np.stack([np.minimum(seg[:, 0], seg[:, 2]), np.minimum(seg[:, 1], seg[:, 3]),
+                          np.maximum(seg[:, 0], seg[:, 2]), np.maximum(seg[:, 1], seg[:, 3])], 1)
+        order = self._StrOrder(boxes)
+        self.segments = seg[order]
+        self.levels = [boxes[order]]
+        while len(self.levels[-1]) > nodeCapacity:
+            b = self.levels[-1]
+            starts = np.arange(0, len(b), nodeCapacity)
+            self.levels.append(np.stack([
+                np.minimum.reduceat(b[:, 0], starts), np.minimum.reduceat(b[:, 1], starts),
+                np.maximum.reduceat(b[:, 2], starts), np.maximum.reduceat(b[:, 3], starts)], 1))
+
+    @classmethod
+    def FromFile(cls, path, layer = None, **kwargs):
+        return(cls(ReadGrwl(path, layer), **kwargs))
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['cache'] = LRUCache(self.maxCached)
+        return(state)
+
+    def _StrOrder(self, boxes):
+        n = len(boxes)
+        if n == 0:
+            return(np.zeros(0, dtype = np.int64))
+        cx = (boxes[:, 0] + boxes[:, 2]) / 2
+        cy = (boxes[:, 1] + boxes[:, 3]) / 2
+        nLeaves = int(math.ceil(n / float(self.nodeCapacity)))
+        sliceSize = int(math.ceil(math.sqrt(nLeaves))) * self.nodeCapacity
+        byX = np.argsort(cx, kind = 'stable')
+        # // within each vertical slice, order by latitude
+        slices = np.arange(n) // sliceSize
+        return(byX[np.lexsort((cy[byX], slices))])
+
+    def Query(self, bound):
+        """indices (into self.segments) of the segments whose bounding box overlaps bound = (lonmin, latmin, lonmax, latmax)
+        """
+        lonmin, latmin, lonmax, latmax = bound
+        candidates = np.arange(len(self.levels[-1]))
+        for level in range(len(self.levels) - 1, -1, -1):
+            b = self.levels[level][candidates]
+            hit = candidates[(b[:, 2] >= lonmin) & (b[:, 0] <= lonmax) & (b[:, 3] >= latmin) & (b[:, 1] <= latmax)]
+            if level == 0:
+                return(hit)
+            children = (hit[:, None] * self.nodeCapacity + np.arange(self.nodeCapacity)).ravel()
+            candidates = children[children < len(self.levels[level - 1])]
+        return(candidates)
+
+    def Lines(self, bound):
+        """overlapping segments as two-vertex lon, lat arrays, usable wherever GetCenterline output is
+        """
+        s = self.segments[self.Query(bound)]
+        return([seg.reshape(2, 2) for seg in s])
+
+    def Paint(self, shape, transform, crs):
+        """rasterize the segments overlapping a grid, with the same half-pixel densification as PaintLines
+        """
+        nr, nc = shape
+        # // lon/lat box of the grid from its edge pixels, padded by a pixel (edges are not straight in lon/lat)
+        er = np.concatenate([np.zeros(nc), np.full(nc, nr - 1), np.arange(nr), np.arange(nr)])
+        ec = np.concatenate([np.arange(nc), np.arange(nc), np.zeros(nr), np.full(nr, nc - 1)])
+        x, y = PixelCoordinates(transform, er, ec)
+        lon, lat = XYToLonLat(x, y, crs)
+        pad = 2.0 * math.sqrt(abs(transform[0] * transform[4] - transform[1] * transform[3]))
+        if not _IsLonLat(crs):
+            pad = pad / 111320.0 / max(math.cos(math.radians(np.max(np.abs(lat)))), 0.01)
+        s = self.segments[self.Query((np.min(lon) - pad, np.min(lat) - pad, np.max(lon) + pad, np.max(lat) + pad))]
+
+        painted = np.zeros(shape, dtype = bool)
+        if len(s) == 0:
+            return(painted)
+        x, y = LonLatToXY(np.concatenate([s[:, 0], s[:, 2]]), np.concatenate([s[:, 1], s[:, 3]]), crs)
+        row, col = PixelIndices(transform, x, y)
+        r0, r1 = row[:len(s)], row[len(s):]
+        c0, c1 = col[:len(s)], col[len(s):]
+        steps = np.maximum(np.ceil(np.hypot(r1 - r0, c1 - c0) * 2), 1).astype(np.int64)
+        seg = np.repeat(np.arange(len(s)), steps + 1)
+        t = (np.arange(len(seg)) - np.repeat(np.cumsum(steps + 1) - (steps + 1), steps + 1)) / steps[seg].astype(np.float64)
+        rr = np.floor(r0[seg] + (r1[seg] - r0[seg]) * t).astype(np.int64)
+        cc = np.floor(c0[seg] + (c1[seg] - c0[seg]) * t).astype(np.int64)
+        inside = (rr >= 0) & (rr < nr) & (cc >= 0) & (cc < nc)
+        painted[rr[inside], cc[inside]] = True
+        return(painted)
+
+    def PaintImage(self, image):
+        """Paint on the grid of a LocalImage, windowed out of the painting cached for its WRS-2 tile
+        """
+        wrs = WrsTile(image)
+        if wrs is None:
+            return(self.Paint(image.shape, image.transform, image.crs))
+        a, b, c, d, e, f = image.transform[:6]
+        key = (wrs, str(image.crs), (a, b, d, e))
+        nr, nc = image.shape
+        cached = self.cache.get(key)
+        if cached is not None:
+            transform, painted = cached
+            offset = _GridOffset(transform, image.transform)
+            if offset is not None:
+                r0, c0 = offset
+                if r0 >= 0 and c0 >= 0 and r0 + nr <= painted.shape[0] and c0 + nc <= painted.shape[1]:
+                    return(painted[r0:r0 + nr, c0:c0 + nc])
+                ## repaint the union of both grids, aligned to the cached one
+                r1, c1 = max(r0 + nr, painted.shape[0]), max(c0 + nc, painted.shape[1])
+                r0, c0 = min(r0, 0), min(c0, 0)
+                transform = (a, b, a * c0 + b * r0 + transform[2], d, e, d * c0 + e * r0 + transform[5])
+                painted = self.Paint((r1 - r0, c1 - c0), transform, image.crs)
+                self.cache.put(key, (transform, painted))
+                return(self.PaintImage(image))
+        painted = self.Paint(image.shape, image.transform, image.crs)
+        self.cache.put(key, (tuple(image.transform[:6]), painted))
+        return(painted)
+
+def _GridOffset(transform, other):
+    """whole-pixel (row, col) of the origin of grid other in grid transform (same pixel size), None if not aligned
+    """
+    row, col = PixelIndices(transform, other[2], other[5])
+    r, c = int(round(float(row))), int(round(float(col)))
+    if abs(row - r) > 1e-6 or abs(col - c) > 1e-6:
+        return(None)
+    return((r, c))
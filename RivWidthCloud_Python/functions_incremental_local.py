@@ -0,0 +1,148 @@
+# /* incremental centerline: recompute the centerline products only around the pixels where the river mask changed */
+import math
+import numpy as np
+from scipy import ndimage
+from functions_local import LocalImage, Window
+
+# // the centerline stages look this many pixels away, besides the distance map itself:
+# // gradient (1), river mask dilation (2), two skeletonization passes of eight thinning steps (16),
+# // end point and corner removal (2), orthogonal angle ring (4) and a spare pixel
+STAGE_REACH = 1 + 2 + 16 + 2 + 4 + 1
+MAX_BRANCH = 300
+
+def CenterlineReach(scale, maxBranchLengthToRemove = MAX_BRANCH):
+    """pixels by which a change of the distance map can move the cleaned centerline and its angles:
+    the local stages plus the two branch pruning passes, each reaching maxBranchLengthToRemove along the centerline
+    """
+    return(STAGE_REACH + 2 * int(math.ceil(maxBranchLengthToRemove / scale)))
+
+def DirtyBoxes(dirty, margin):
+    """bounding boxes (r0, r1, c0, c1) of the groups of dirty pixels, grouping pixels less than 2 * margin apart
+    """
+    # // margin dilations by the 3 x 3 square, in one separable pass
+    grouped = ndimage.maximum_filter(dirty, size = 2 * margin + 1) if margin > 0 else dirty
+    labels, n = ndimage.label(grouped, structure = np.ones((3, 3), dtype = bool))
+    boxes = []
+    # // boxes of the dirty pixels of each group, not of the grown groups
+    for sl in ndimage.find_objects(np.where(dirty, labels, 0), n):
+        if sl is not None:
+            boxes.append((sl[0].start, sl[0].stop, sl[1].start, sl[1].stop))
+    return(boxes)
+
+def Grow(box, margin, shape):
+    r0, r1, c0, c1 = box
+    return((max(r0 - margin, 0), min(r1 + margin, shape[0]), max(c0 - margin, 0), min(c1 + margin, shape[1])))
+
+def RadiusBound(distance, scale, distanceCap = None):
+    """largest distance to bank (pixels) in distance (meters, nan off the river) plus a margin of 3 pixels,
+    at most distanceCap + 3
+    """
+    finite = np.isfinite(distance)
+    largest = np.max(distance[finite]) / scale if finite.any() else 0
+    if distanceCap is not None:
+        largest = min(largest, distanceCap)
+    return(int(math.ceil(largest)) + 3)
+
+def LocalRadius(distance, box, scale, extent, start = 0, distanceCap = None):
+    """smallest radius r >= start (pixels) with RadiusBound(distance within r + extent of box) <= r
+
+    a pixel whose distance to bank depends on the outline inside box lies that distance away from box; distances vary by
+    at most a pixel per pixel, so no pixel farther than r from box can depend on it. every pixel within r + extent of box
+    also has its nearest bank within r, so a window reaching r beyond that computes its distance exactly.
+    only the neighbourhood of box counts, so a wide river or lake elsewhere in the scene does not enlarge the windows
+    """
+    r = start
+    while True:
+        r0, r1, c0, c1 = Grow(box, r + extent, distance.shape)
+        need = RadiusBound(distance[r0:r1, c0:c1], scale, distanceCap)
+        if need <= r:
+            return(r)
+        r = need
+
+class IncrementalCenterline(object):
+    """cache of the centerline products (distanceMap, gradientMap, rawCL, cleanedCL, orthDegree) of the last river mask on a grid
+
+    Update diffs a new riverMask against the cached one and reruns CalculateCenterline and CalculateOrthAngle only on windows
+    around the changed pixels, splicing the parts that can have changed back into the cache:
+    - a changed mask pixel moves the bank outline within 2 pixels, which changes distances within R pixels, R being the
+      largest distance to bank (in pixels, old or new) in the neighbourhood of the change (see LocalRadius)
+    - centerline and angles then change within CenterlineReach of a changed distance
+    - the window adds another R + CenterlineReach so that window edges do not affect the spliced part
+    the result is the same as a full recomputation; if the windows cover more than maxDirtyFraction of the scene, or the
+    grid changed, everything is recomputed. recomputed holds the number of pixels processed by the last Update
+    """
+
+    PRODUCTS = ['distanceMap', 'gradientMap', 'rawCL', 'cleanedCL', 'orthDegree']
+
+    def __init__(self, distanceCap = None, maxDirtyFraction = 0.25):
+        self.distanceCap = distanceCap
+        self.maxDirtyFraction = maxDirtyFraction
+        self.grid = None
+        self.riverMask = None
+        self.products = None
+        self.recomputed = 0
+
+    def _Full(self, image):
+        from functions_centerline_width_local import CalculateCenterline, CalculateOrthAngle
+        out = CalculateOrthAngle(CalculateCenterline(image, self.distanceCap))
+        return(dict((k, out.band(k)) for k in self.PRODUCTS))
+
+    def _Window(self, riverMask, window, transform, crs):
+        r0, r1, c0, c1 = window
+        image = Window(LocalImage({'riverMask': riverMask}, transform, crs), r0, r1, c0, c1)
+        return(self._Full(image))
+
+    def Update(self, imgIn):
+        """imgIn with the centerline product bands added, as CalculateOrthAngle(CalculateCenterline(imgIn, distanceCap))
+        """
+        riverMask = imgIn.band('riverMask') == 1
+        scale = imgIn.get('scale')
+        grid = (imgIn.shape, tuple(imgIn.transform[:6]), str(imgIn.crs))
+
+        if self.grid != grid:
+            products = self._Full(imgIn)
+            self.recomputed = riverMask.size
+        else:
+            products = self._Incremental(riverMask, imgIn, scale)
+
+        self.grid = grid
+        self.riverMask = riverMask
+        self.products = products
+        return(imgIn.addBands(dict((k, v.copy()) for k, v in products.items())))
+
+    def _Incremental(self, riverMask, imgIn, scale):
+        # // changed pixels, grown by the 2 pixel reach of the bank outline
+        dirty = ndimage.maximum_filter(riverMask != self.riverMask, size = 7)
+        self.recomputed = 0
+        if not dirty.any():
+            return(dict((k, v.copy()) for k, v in self.products.items()))
+
+        reach = CenterlineReach(scale)
+        oldDistance = self.products['distanceMap']
+
+        products = dict((k, v.copy()) for k, v in self.products.items())
+        for box in DirtyBoxes(dirty, reach):
+            # // distances within 2 * reach of the spliced part (radius + reach around box) feed its centerline
+            radius = LocalRadius(oldDistance, box, scale, 2 * reach, 0, self.distanceCap)
+            while True:
+                inner = Grow(box, radius + reach, riverMask.shape)
+                window = Grow(box, 2 * (radius + reach), riverMask.shape)
+                area = (window[1] - window[0]) * (window[3] - window[2])
+                if self.recomputed + area > self.maxDirtyFraction * riverMask.size:
+                    self.recomputed = riverMask.size
+                    return(self._Full(imgIn))
+                part = self._Window(riverMask, window, imgIn.transform, imgIn.crs)
+                # // new distances can exceed the old ones (e.g. a river widened): grow the radius until it bounds them too
+                near = Grow(box, radius + 2 * reach, riverMask.shape)
+                d = part['distanceMap'][(near[0] - window[0]):(near[1] - window[0]), (near[2] - window[2]):(near[3] - window[2])]
+                need = RadiusBound(d, scale, self.distanceCap)
+                if need <= radius:
+                    break
+                radius = LocalRadius(oldDistance, box, scale, 2 * reach, need, self.distanceCap)
+
+            self.recomputed += area
+            r0, r1, c0, c1 = inner
+            wr, wc = r0 - window[0], c0 - window[2]
+            for k in self.PRODUCTS:
+                products[k][r0:r1, c0:c1] = part[k][wr:wr + r1 - r0, wc:wc + c1 - c0]
+        return(products)
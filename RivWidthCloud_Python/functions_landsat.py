@@ -1,31 +1,77 @@
 import ee
+from functions_landsat_qa import QA_SHIFT, QA_BITS, FLAG_BANDS, FmaskLookupTable
+
+## standardize band names
+bn8 = ['B1', 'B2', 'B3', 'B4', 'B6', 'pixel_qa', 'B5', 'B7']
+bn7 = ['B1', 'B1', 'B2', 'B3', 'B5', 'pixel_qa', 'B4', 'B7']
+bn5 = ['B1', 'B1', 'B2', 'B3', 'B5', 'pixel_qa', 'B4', 'B7']
+bns = ['uBlue', 'Blue', 'Green', 'Red', 'Swir1', 'BQA', 'Nir', 'Swir2']
+
+## collection and band names of each sensor, keyed by the LANDSAT_ID prefix
+SENSOR_COLLECTIONS = {
+    'LT05': ("LANDSAT/LT05/C01/T1_SR", bn5),
+    'LE07': ("LANDSAT/LE07/C01/T1_SR", bn7),
+    'LC08': ("LANDSAT/LC08/C01/T1_SR", bn8)}
+
+## landsat 7 scenes used in the merged collection (before the SLC failure)
+LE07_DATE_RANGE = ('1999-04-15', '2003-05-30')
+
+_merged = None
 
 def merge_collections_std_bandnames_collection1tier1_sr():
     """merge landsat 5, 7, 8 collection 1 tier 1 SR imageCollections and standardize band names
+
+    the merged collection is built once per process and reused
     """
-    ## standardize band names
-    bn8 = ['B1', 'B2', 'B3', 'B4', 'B6', 'pixel_qa', 'B5', 'B7']
-    bn7 = ['B1', 'B1', 'B2', 'B3', 'B5', 'pixel_qa', 'B4', 'B7']
-    bn5 = ['B1', 'B1', 'B2', 'B3', 'B5', 'pixel_qa', 'B4', 'B7']
-    bns = ['uBlue', 'Blue', 'Green', 'Red', 'Swir1', 'BQA', 'Nir', 'Swir2']
+    global _merged
+    if _merged is not None:
+        return(_merged)
 
     # create a merged collection from landsat 5, 7, and 8
-    ls5 = ee.ImageCollection("LANDSAT/LT05/C01/T1_SR").select(bn5, bns)
+    ls5 = ee.ImageCollection(SENSOR_COLLECTIONS['LT05'][0]).select(bn5, bns)
 
-    ls7 = (ee.ImageCollection("LANDSAT/LE07/C01/T1_SR")
-           .filterDate('1999-04-15', '2003-05-30')
+    ls7 = (ee.ImageCollection(SENSOR_COLLECTIONS['LE07'][0])
+           .filterDate(LE07_DATE_RANGE[0], LE07_DATE_RANGE[1])
            .select(bn7, bns))
 
-    ls8 = ee.ImageCollection("LANDSAT/LC08/C01/T1_SR").select(bn8, bns)
+    ls8 = ee.ImageCollection(SENSOR_COLLECTIONS['LC08'][0]).select(bn8, bns)
+
+    _merged = ls5.merge(ls7).merge(ls8)
 
-    merged = ls5.merge(ls7).merge(ls8)
+    return(_merged)
 
-    return(merged)
+def id2AssetId(id):
+    """asset path of a collection 1 tier 1 SR scene given its LANDSAT_ID
+    (e.g. LC08_L1TP_022034_20130422_20170310_01_T1 -> LANDSAT/LC08/C01/T1_SR/LC08_022034_20130422),
+    None if the ID cannot be routed directly to a scene of the merged collection
+    """
+    parts = id.split('_')
+    if len(parts) != 7 or parts[0] not in SENSOR_COLLECTIONS or parts[6] != 'T1':
+        return(None)
+    sensor, pathrow, date = parts[0], parts[2], parts[3]
+    if sensor == 'LE07':
+        isoDate = date[:4] + '-' + date[4:6] + '-' + date[6:]
+        if not (LE07_DATE_RANGE[0] <= isoDate < LE07_DATE_RANGE[1]):
+            return(None)
+    return(SENSOR_COLLECTIONS[sensor][0] + '/' + '_'.join([sensor, pathrow, date]))
 
 def id2Img(id):
-    return(ee.Image(merge_collections_std_bandnames_collection1tier1_sr()
-    .filterMetadata('LANDSAT_ID', 'equals', id)
-    .first()))
+    assetId = id2AssetId(id)
+    if assetId is None:
+        # // not a routable ID: fall back to searching the merged collection
+        return(ee.Image(merge_collections_std_bandnames_collection1tier1_sr()
+        .filterMetadata('LANDSAT_ID', 'equals', id)
+        .first()))
+    return(ee.Image(assetId).select(SENSOR_COLLECTIONS[id.split('_')[0]][1], bns))
+
+def batch_id2Img(ids):
+    """resolve many LANDSAT_IDs at once; returns the images in the order of ids, resolving repeated IDs only once
+    """
+    resolved = {}
+    for id in ids:
+        if id not in resolved:
+            resolved[id] = id2Img(id)
+    return([resolved[id] for id in ids])
 
 def Unpack(bitBand, startingBit, bitWidth):
     # unpacking bit bands
@@ -55,6 +101,20 @@ def AddFmaskSR(image):
 
     return image.addBands(fmask)
 
+def DecodeQASR(image):
+    """fused QA decoding: fmask from a single remap of QA bits 2-5, and the four flags from one comparison
+    against a constant image (same values as AddFmaskSR and the flag bands of CalculateWaterAddFlagsSR)
+    """
+    qa = image.select(['BQA'])
+    fmask = (qa.rightShift(QA_SHIFT).bitwiseAnd(2 ** QA_BITS - 1)
+    .remap(list(range(2 ** QA_BITS)), FmaskLookupTable())
+    .rename(['fmask']))
+
+    flags = (fmask.eq(ee.Image.constant([c for (name, c) in FLAG_BANDS]))
+    .rename([name for (name, c) in FLAG_BANDS]))
+
+    return(fmask.addBands(flags))
+
 def CalcHillShadowSR(image):
     dem = ee.Image("users/eeProject/MERIT").clip(image.geometry().buffer(9000).bounds())
     SOLAR_AZIMUTH_ANGLE = ee.Number(image.get('SOLAR_AZIMUTH_ANGLE'))
@@ -77,12 +137,9 @@ def ClassifyWater(imgIn, method = 'Jones2019'):
 def CalculateWaterAddFlagsSR(imgIn, waterMethod = 'Jones2019'):
     # waterMethod = typeof waterMethod !== 'undefined' ? waterMethod : 'Jones2019';
 
-    fmask = AddFmaskSR(imgIn).select(['fmask'])
-
-    fmaskUnpacked = (fmask.eq(4).rename('flag_cloud')
-    .addBands(fmask.eq(2).rename('flag_cldShadow'))
-    .addBands(fmask.eq(3).rename('flag_snowIce'))
-    .addBands(fmask.eq(1).rename('flag_water')))
+    decoded = DecodeQASR(imgIn)
+    fmask = decoded.select(['fmask'])
+    fmaskUnpacked = decoded.select(['flag_.*'])
 
     water = ClassifyWater(imgIn, waterMethod).where(fmask.gte(2), ee.Image.constant(0))
     hillshadow = CalcHillShadowSR(imgIn).Not().rename(['flag_hillshadow'])
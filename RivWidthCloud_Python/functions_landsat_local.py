@@ -0,0 +1,138 @@
+import math
+import numpy as np
+from functions_local import Shift
+from functions_landsat_qa import QA_SHIFT, QA_BITS, FLAG_BANDS, FmaskLookupTable
+
+## standardized band names, as in functions_landsat
+bn8 = ['B1', 'B2', 'B3', 'B4', 'B6', 'pixel_qa', 'B5', 'B7']
+bn7 = ['B1', 'B1', 'B2', 'B3', 'B5', 'pixel_qa', 'B4', 'B7']
+bn5 = ['B1', 'B1', 'B2', 'B3', 'B5', 'pixel_qa', 'B4', 'B7']
+bns = ['uBlue', 'Blue', 'Green', 'Red', 'Swir1', 'BQA', 'Nir', 'Swir2']
+SENSOR_BANDS = {'LT05': bn5, 'LE07': bn7, 'LC08': bn8}
+
+## standardized bands read by the local pipeline for each water classification method (BQA for the flags and footprint)
+REQUIRED_BANDS = {
+    'Jones2019': ['Blue', 'Green', 'Red', 'Nir', 'Swir1', 'Swir2', 'BQA'],
+    'Zou2018': ['Blue', 'Green', 'Red', 'Nir', 'Swir1', 'BQA']}
+
+def Unpack(bitBand, startingBit, bitWidth):
+    # unpacking bit bands
+    return ((bitBand.astype(np.int64) >> startingBit) & (2 ** bitWidth - 1))
+
+def UnpackAllSR(bitBand):
+    # apply Unpack function for multiple pixel qualities
+    bitInfoSR = {
+    'Cloud': [5, 1],
+    'CloudShadow': [3, 1],
+    'SnowIce': [4, 1],
+    'Water': [2, 1]
+    }
+    unpacked = dict((key, Unpack(bitBand, bitInfoSR[key][0], bitInfoSR[key][1])) for key in bitInfoSR)
+    return unpacked
+
+def AddFmaskSR(image):
+    # // add fmask as a separate band to the input image
+    temp = UnpackAllSR(image.band('BQA'))
+
+    fmask = temp['Water'].astype(np.uint8)
+    fmask[temp['SnowIce'] == 1] = 3
+    fmask[temp['CloudShadow'] == 1] = 2
+    fmask[temp['Cloud'] == 1] = 4
+
+    return image.addBands({'fmask': fmask})
+
+## fmask class in bits 0-2, then the FLAG_BANDS flags in bits 3-6
+QA_LUT = np.array([f | sum((f == c) << (3 + k) for k, (name, c) in enumerate(FLAG_BANDS)) for f in FmaskLookupTable()], dtype = np.uint8)
+
+def DecodeQASR(bitBand):
+    """fused QA decoding: one table lookup gives fmask and the four fmask flags (same values as AddFmaskSR
+    and the flag bands of CalculateWaterAddFlagsSR)
+    """
+    code = np.take(QA_LUT, (bitBand.astype(np.int64) >> QA_SHIFT) & (2 ** QA_BITS - 1))
+    decoded = {'fmask': code & 7}
+    for k, (name, c) in enumerate(FLAG_BANDS):
+        decoded[name] = (code >> (3 + k)) & 1
+    return(decoded)
+
+def HillShadow(dem, azimuth, zenith, scale, maxDistance = 9000, xScale = None):
+    """local equivalent of ee.Terrain.hillShadow: 1 where lit, 0 where a ray towards the sun hits terrain within maxDistance (meters)
+
+    scale: pixel size (meters) along the columns; xScale: pixel size along the rows, a number or one value per row
+    (e.g. scale * cos(latitude) on a lon, lat grid), scale if not given
+    """
+    nr = dem.shape[0]
+    xs = np.broadcast_to(np.asarray(scale if xScale is None else xScale, dtype = np.float64), (nr,))
+    # // march at roughly the 90 m MERIT resolution used by the server version, without skipping pixels of the finer axis
+    stepMeters = max(1, int(round(90.0 / scale))) * min(scale, float(np.min(xs)))
+    azRad = math.radians(azimuth)
+    tanElev = math.tan(math.radians(90.0 - zenith))
+    dem = dem.astype(np.float64)
+    shadow = np.zeros(dem.shape, dtype = bool)
+    d = stepMeters
+    while (d <= maxDistance):
+        dr = -int(round(d * math.cos(azRad) / scale))
+        dcs = np.rint(d * math.sin(azRad) / xs).astype(np.int64)
+        for dc in np.unique(dcs):
+            rows = dcs == dc
+            ahead = Shift(dem, dr, int(dc), -np.inf)
+            horizontal = np.hypot(dc * xs[rows], dr * scale)[:, None]
+            shadow[rows] |= ahead[rows] > dem[rows] + horizontal * tanElev
+        d = d + stepMeters
+    return((~shadow).astype(np.uint8))
+
+def CalcHillShadowSR(image, dem = None, lonLat = None):
+    """hill shadow from the memoized tiles of a functions_dem_local.DemProvider if given, otherwise from the 'dem' band
+    lonLat: optional (lon, lat) grids of the pixel centers, used to look up the tiles instead of reprojecting the grid
+    """
+    if dem is not None:
+        from functions_dem_local import HillShadowOnGrid
+        return(HillShadowOnGrid(dem, image.shape, image.get('transform'), image.get('crs'), float(image.get('SOLAR_AZIMUTH_ANGLE')), float(image.get('SOLAR_ZENITH_ANGLE')), lonLat))
+    if 'dem' not in image.bands:
+        return(np.ones(image.shape, dtype = np.uint8))
+    return(HillShadow(image.band('dem'), float(image.get('SOLAR_AZIMUTH_ANGLE')), float(image.get('SOLAR_ZENITH_ANGLE')), image.get('scale')))
+
+def Footprint(image):
+    # // valid pixels of the scene: inside the array footprint and not flagged as fill in the QA band
+    return(image.footprint & (Unpack(image.band('BQA'), 0, 1) == 0))
+
+# /* functions to classify water (default) */
+def ClassifyWater(imgIn, method = 'Jones2019'):
+
+    if method == 'Jones2019':
+        from functions_waterClassification_Jones2019_local import ClassifyWaterJones2019
+        return(ClassifyWaterJones2019(imgIn))
+    elif method == 'Zou2018':
+        from functions_waterClassification_Zou2018_local import ClassifyWaterZou2018
+        return(ClassifyWaterZou2018(imgIn))
+
+# /* water function */
+def CalculateWaterAddFlagsSR(imgIn, waterMethod = 'Jones2019', dem = None, lonLat = None):
+
+    if dem is not None and lonLat is None:
+        # // reproject the grid once for both lookups in the DEM tiles
+        from functions_local import PixelLonLat
+        lonLat = PixelLonLat(imgIn.shape, imgIn.get('transform'), imgIn.get('crs'))
+
+    fmaskUnpacked = DecodeQASR(imgIn.band('BQA'))
+    fmask = fmaskUnpacked.pop('fmask')
+
+    water = ClassifyWater(imgIn, waterMethod)
+    water[fmask >= 2] = 0
+    hillshadow = 1 - CalcHillShadowSR(imgIn, dem, lonLat)
+
+    bands = {'waterMask': water, 'fmask': fmask, 'flag_hillshadow': hillshadow}
+    bands.update(fmaskUnpacked)
+    if 'dem' in imgIn.bands:
+        bands['dem'] = imgIn.band('dem')
+    elif dem is not None:
+        # // elevation for flag_elevation, sampled from the same cached tiles as the hill shadow
+        from functions_dem_local import DemOnGrid
+        bands['dem'] = DemOnGrid(dem, imgIn.shape, imgIn.get('transform'), imgIn.get('crs'), lonLat)
+
+    imgOut = (imgIn.copy(bands = bands, footprint = Footprint(imgIn))
+    .setMulti({
+        'image_id': imgIn.get('LANDSAT_ID'),
+        'timestamp': imgIn.get('system:time_start')
+    }))
+
+    return(imgOut)
@@ -0,0 +1,25 @@
+# /* pixel_qa decoding tables shared by functions_landsat (Earth Engine) and functions_landsat_local (numpy) */
+
+## fmask only depends on bits 2-5 of pixel_qa (water, cloud shadow, snow/ice, cloud)
+QA_SHIFT = 2
+QA_BITS = 4
+
+## flag bands derived from fmask, with the fmask class each one marks
+FLAG_BANDS = [('flag_cloud', 4), ('flag_cldShadow', 2), ('flag_snowIce', 3), ('flag_water', 1)]
+
+def FmaskLookupTable():
+    """16-entry table from the QA bits 2-5 to the fmask class, with the precedence of AddFmaskSR:
+    cloud (4) over cloud shadow (2) over snow/ice (3) over water (1)
+    """
+    lut = []
+    for index in range(2 ** QA_BITS):
+        water, cloudShadow, snowIce, cloud = [(index >> bit) & 1 for bit in range(4)]
+        if cloud:
+            lut.append(4)
+        elif cloudShadow:
+            lut.append(2)
+        elif snowIce:
+            lut.append(3)
+        else:
+            lut.append(water)
+    return(lut)
@@ -0,0 +1,202 @@
+import re
+import numpy as np
+from collections import OrderedDict
+
+class LocalImage(object):
+    """in-memory counterpart of ee.Image: named 2D bands that share one grid
+
+    transform: affine coefficients (a, b, c, d, e, f) so that x = a * col + b * row + c and y = d * col + e * row + f
+    footprint: boolean array of valid pixels (the image mask); defaults to every pixel being valid
+    """
+
+    def __init__(self, bands, transform, crs, properties = None, footprint = None):
+        self.bands = OrderedDict(bands)
+        self.transform = tuple(transform)[:6]
+        self.crs = crs
+        self.properties = dict(properties or {})
+        if footprint is None:
+            footprint = np.ones(self.shape, dtype = bool)
+        self.footprint = footprint
+
+    @property
+    def shape(self):
+        if self.bands:
+            return(next(iter(self.bands.values())).shape)
+        return(self.footprint.shape)
+
+    def bandNames(self):
+        return(list(self.bands.keys()))
+
+    def band(self, name):
+        return(self.bands[name])
+
+    def select(self, names):
+        # // band names are matched as regular expressions, the same way ee.Image.select does
+        if isinstance(names, str):
+            names = [names]
+        selected = OrderedDict()
+        for name in names:
+            matched = [b for b in self.bands if re.fullmatch(name, b)]
+            if not matched:
+                raise KeyError('band not found: ' + name)
+            for b in matched:
+                selected[b] = self.bands[b]
+        return(self.copy(bands = selected))
+
+    def addBands(self, bands):
+        if isinstance(bands, LocalImage):
+            bands = bands.bands
+        merged = OrderedDict(self.bands)
+        merged.update(bands)
+        return(self.copy(bands = merged))
+
+    def get(self, key):
+        if key == 'crs':
+            return(self.crs)
+        if key == 'scale':
+            return(PixelScale(self.transform))
+        if key == 'transform':
+            return(self.transform)
+        return(self.properties.get(key))
+
+    def setMulti(self, properties):
+        merged = dict(self.properties)
+        merged.update(properties)
+        return(self.copy(properties = merged))
+
+    def copy(self, bands = None, properties = None, footprint = None):
+        return(LocalImage(
+            self.bands if bands is None else bands,
+            self.transform,
+            self.crs,
+            self.properties if properties is None else properties,
+            self.footprint if footprint is None else footprint))
+
+class LRUCache(object):
+    """dictionary keeping at most maxSize items, evicting the least recently used one"""
+
+    def __init__(self, maxSize):
+        self.maxSize = maxSize
+        self.items = OrderedDict()
+
+    def get(self, key):
+        if key not in self.items:
+            return(None)
+        self.items.move_to_end(key)
+        return(self.items[key])
+
+    def put(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while len(self.items) > self.maxSize:
+            self.items.popitem(last = False)
+
+def PixelScale(transform):
+    # // nominal pixel size in crs units
+    a, b, c, d, e, f = transform[:6]
+    return(float(np.sqrt(abs(a * e - b * d))))
+
+def PixelCoordinates(transform, rows, cols):
+    """x and y (crs units) of the centers of the given pixels
+    """
+    a, b, c, d, e, f = transform[:6]
+    col = np.asarray(cols, dtype = np.float64) + 0.5
+    row = np.asarray(rows, dtype = np.float64) + 0.5
+    return(a * col + b * row + c, d * col + e * row + f)
+
+def PixelIndices(transform, x, y):
+    """fractional (row, col) of crs coordinates; pixel (r, c) covers [r, r + 1) x [c, c + 1)
+    """
+    a, b, c, d, e, f = transform[:6]
+    det = a * e - b * d
+    x = np.asarray(x, dtype = np.float64) - c
+    y = np.asarray(y, dtype = np.float64) - f
+    col = (e * x - b * y) / det
+    row = (-d * x + a * y) / det
+    return(row, col)
+
+def _Transformer(crsFrom, crsTo):
+    try:
+        from pyproj import Transformer
+    except ImportError:
+        raise ImportError('pyproj is required to convert between ' + str(crsFrom) + ' and ' + str(crsTo))
+    return(Transformer.from_crs(crsFrom, crsTo, always_xy = True))
+
+def _IsLonLat(crs):
+    return(str(crs).upper() in ('EPSG:4326', 'WGS84', 'CRS:84'))
+
+def XYToLonLat(x, y, crs):
+    if _IsLonLat(crs):
+        return(np.asarray(x, dtype = np.float64), np.asarray(y, dtype = np.float64))
+    return(_Transformer(crs, 'EPSG:4326').transform(x, y))
+
+def LonLatToXY(lon, lat, crs):
+    if _IsLonLat(crs):
+        return(np.asarray(lon, dtype = np.float64), np.asarray(lat, dtype = np.float64))
+    return(_Transformer('EPSG:4326', crs).transform(lon, lat))
+
+def PixelLonLat(shape, transform, crs):
+    """(lon, lat) grids of the pixel centers of a grid, for the lookups (DEM tiles, width table) that need them for every pixel
+    """
+    rows, cols = np.indices(shape)
+    x, y = PixelCoordinates(transform, rows, cols)
+    return(XYToLonLat(x, y, crs))
+
+def Shift(arr, dr, dc, fill = 0):
+    """out[r, c] = arr[r + dr, c + dc], pixels shifted in from outside the array take the value fill
+    """
+    out = np.full_like(arr, fill)
+    nr, nc = arr.shape
+    if abs(dr) >= nr or abs(dc) >= nc:
+        return(out)
+    out[max(0, -dr):nr - max(0, dr), max(0, -dc):nc - max(0, dc)] = arr[max(0, dr):nr - max(0, -dr), max(0, dc):nc - max(0, -dc)]
+    return(out)
+
+def PaintLines(lines, shape, transform, crs):
+    """rasterize polylines given as (N, 2) arrays of lon, lat vertices, the local equivalent of ee.Image().paint(lines, 1)
+    """
+    painted = np.zeros(shape, dtype = bool)
+    for line in lines:
+        line = np.asarray(line, dtype = np.float64)
+        if line.shape[0] == 0:
+            continue
+        x, y = LonLatToXY(line[:, 0], line[:, 1], crs)
+        row, col = PixelIndices(transform, x, y)
+        if line.shape[0] == 1:
+            rr, cc = row, col
+        else:
+            # // densify each segment to at most half a pixel between samples
+            steps = np.maximum(np.ceil(np.hypot(np.diff(row), np.diff(col)) * 2), 1).astype(np.int64)
+            t = np.concatenate([np.arange(n) / float(n) for n in steps] + [np.array([1.0])])
+            seg = np.concatenate([np.full(n, i) for i, n in enumerate(steps)] + [np.array([len(steps) - 1])])
+            rr = row[seg] + (row[seg + 1] - row[seg]) * t
+            cc = col[seg] + (col[seg + 1] - col[seg]) * t
+        rr = np.floor(rr).astype(np.int64)
+        cc = np.floor(cc).astype(np.int64)
+        inside = (rr >= 0) & (rr < shape[0]) & (cc >= 0) & (cc < shape[1])
+        painted[rr[inside], cc[inside]] = True
+    return(painted)
+
+def ClipToBounds(image, bounds):
+    """clip a north-up image to the window covering bounds = (xmin, ymin, xmax, ymax) in the image crs
+    """
+    a, b, c, d, e, f = image.transform
+    if b != 0 or d != 0:
+        raise ValueError('clipping requires a north-up transform')
+    xmin, ymin, xmax, ymax = bounds
+    rows, cols = PixelIndices(image.transform, [xmin, xmax], [ymin, ymax])
+    r0 = int(max(np.floor(rows.min()), 0))
+    r1 = int(min(np.ceil(rows.max()), image.shape[0]))
+    c0 = int(max(np.floor(cols.min()), 0))
+    c1 = int(min(np.ceil(cols.max()), image.shape[1]))
+    if r1 <= r0 or c1 <= c0:
+        raise ValueError('bounds do not overlap the image')
+    return(Window(image, r0, r1, c0, c1))
+
+def Window(image, r0, r1, c0, c1):
+    """sub-image covering rows r0:r1 and columns c0:c1, with the transform moved accordingly
+    """
+    a, b, c, d, e, f = image.transform
+    bands = OrderedDict((k, v[r0:r1, c0:c1]) for k, v in image.bands.items())
+    transform = (a, b, a * c0 + b * r0 + c, d, e, d * c0 + e * r0 + f)
+    return(LocalImage(bands, transform, image.crs, image.properties, image.footprint[r0:r1, c0:c1]))
@@ -0,0 +1,201 @@
+# /* streaming width output: local width tables appended to Parquet, GeoParquet or Arrow files in row-group chunks */
+import os
+import json
+import numpy as np
+from collections import OrderedDict
+
+FORMATS = {'parquet': '.parquet', 'geoparquet': '.parquet', 'arrow': '.arrow'}
+
+def PathRow(imageId):
+    """WRS-2 'PPPRRR' from a LANDSAT_ID (e.g. LC08_L1TP_022034_20130422_20170310_01_T1 -> '022034'), '' if not a Landsat id
+    """
+    parts = str(imageId).split('_')
+    if len(parts) > 2 and len(parts[2]) == 6 and parts[2].isdigit():
+        return(parts[2])
+    return('')
+
+def PointWkb(lon, lat):
+    # // little-endian WKB points, the GeoParquet geometry encoding
+    n = len(lon)
+    buf = np.zeros(n, dtype = [('order', 'u1'), ('type', '<u4'), ('x', '<f8'), ('y', '<f8')])
+    buf['order'] = 1
+    buf['type'] = 1
+    buf['x'] = lon
+    buf['y'] = lat
+    raw = buf.tobytes()
+    return([raw[21 * k:21 * (k + 1)] for k in range(n)])
+
+class WidthWriter(object):
+    """write width tables (as returned by rwGenSRLocal) to a local directory, one file per partition
+
+    tables are buffered per partition and written out as row groups (Parquet) or record batches (Arrow) of
+    rowGroupSize rows, so memory stays bounded however many scenes are streamed through
+    - fmt: 'parquet', 'geoparquet' (adds a WKB point geometry column and the 'geo' metadata) or 'arrow' (IPC file)
+    - partitionBy: None, 'image_id' or 'path_row'; partitions are hive-style sub directories (image_id=.../part-0.parquet)
+    - maxOpenFiles: partitions with an open file; the least recently written one is finished (and a later write to it
+      starts its next part-N file) when more are needed
+
+    the first table fixes the columns and their types for every file of the sink; a later table with other columns
+    raises a ValueError, and columns of another type are cast to the stored one where that loses nothing (e.g. a float
+    column of whole numbers into an int column), a ValueError otherwise
+
+    use as a context manager, or call close() to flush the buffers and finish the files
+    """
+
+    def __init__(self, directory, fmt = 'parquet', partitionBy = 'image_id', rowGroupSize = 65536, compression = 'zstd', maxOpenFiles = 64):
+        if fmt not in FORMATS:
+            raise ValueError('unknown output format {}'.format(fmt))
+        if partitionBy not in (None, 'image_id', 'path_row'):
+            raise ValueError('partitionBy must be None, image_id or path_row')
+        self.directory = directory
+        self.fmt = fmt
+        self.partitionBy = partitionBy
+        self.rowGroupSize = rowGroupSize
+        self.compression = compression
+        self.maxOpenFiles = maxOpenFiles
+        self.maxBufferedRows = 4 * rowGroupSize
+        self.buffers = OrderedDict()
+        self.writers = OrderedDict()
+        self.nFiles = {}
+        self.columns = None
+        self.schema = None
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _Partition(self, imageId):
+        if self.partitionBy is None:
+            return('')
+        if self.partitionBy == 'image_id':
+            return('image_id=' + str(imageId))
+        return('path_row=' + PathRow(imageId))
+
+    def write(self, table, timestamp = None):
+        """append one width table; image_id comes from its column, timestamp (system:time_start, ms) from the argument
+        if the table has no timestamp column
+        """
+        if table is None or not len(table) or not len(next(iter(table.values()))):
+            return
+        table = OrderedDict(table)
+        if 'timestamp' not in table:
+            if timestamp is None:
+                raise ValueError('the width table has no timestamp column; pass timestamp')
+            table['timestamp'] = np.full(len(table['image_id']), timestamp, dtype = np.int64)
+        table = OrderedDict((k, np.asarray(v)) for k, v in table.items())
+        if self.columns is None:
+            self.columns = OrderedDict((k, v.dtype) for k, v in table.items())
+        elif set(table) != set(self.columns):
+            missing = [k for k in self.columns if k not in table]
+            unexpected = [k for k in table if k not in self.columns]
+            raise ValueError('width table columns differ from the first table written: missing {}, unexpected {}'.format(missing, unexpected))
+        else:
+            table = self._Conform(table)
+
+        ids = np.asarray(table['image_id'], dtype = object)
+        for imageId in OrderedDict.fromkeys(ids.tolist()):
+            sel = ids == imageId
+            part = self._Partition(imageId)
+            buf = self.buffers.setdefault(part, [])
+            buf.append(OrderedDict((k, v[sel]) for k, v in table.items()))
+            if sum(len(b['image_id']) for b in buf) >= self.rowGroupSize:
+                self._Flush(part, False)
+        # // partitions that stay small (e.g. one scene per image_id partition) are written out oldest first
+        while len(self.buffers) > 1 and self._Buffered() > self.maxBufferedRows:
+            self._Flush(next(iter(self.buffers)))
+
+    def _Conform(self, table):
+        # // columns in the order and, where nothing is lost, the dtypes of the first table, so buffers concatenate alike
+        out = OrderedDict()
+        mismatched = []
+        for (k, dtype) in self.columns.items():
+            v = table[k]
+            if v.dtype != dtype and dtype != object:
+                try:
+                    with np.errstate(invalid = 'ignore'):
+                        cast = v.astype(dtype)
+                    lossless = np.array_equal(cast.astype(v.dtype), v, equal_nan = v.dtype.kind == 'f')
+                except (TypeError, ValueError):
+                    lossless = False
+                if not lossless:
+                    mismatched.append('{} ({} instead of {})'.format(k, v.dtype, dtype))
+                    continue
+                v = cast
+            out[k] = v
+        if mismatched:
+            raise ValueError('width table columns do not match the types of the first table written: ' + ', '.join(mismatched))
+        return(out)
+
+    def _Buffered(self):
+        return(sum(len(b['image_id']) for buf in self.buffers.values() for b in buf))
+
+    def _Batch(self, columns):
+        import pyarrow as pa
+
+        arrays = OrderedDict()
+        for k, v in columns.items():
+            arrays[k] = pa.array(v.tolist() if v.dtype == object else v)
+        if self.fmt == 'geoparquet':
+            arrays['geometry'] = pa.array(PointWkb(columns['longitude'], columns['latitude']), type = pa.binary())
+        if self.schema is None:
+            # // the first batch fixes the schema of every file of the sink
+            schema = pa.RecordBatch.from_arrays(list(arrays.values()), names = list(arrays.keys())).schema
+            if self.fmt == 'geoparquet':
+                geo = {'version': '1.0.0', 'primary_column': 'geometry', 'columns': {'geometry': {
+                    'encoding': 'WKB', 'geometry_types': ['Point']}}}
+                schema = schema.with_metadata({'geo': json.dumps(geo)})
+            self.schema = schema
+        mismatched = []
+        for field in self.schema:
+            if arrays[field.name].type != field.type:
+                try:
+                    arrays[field.name] = arrays[field.name].cast(field.type)
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                    mismatched.append('{} ({} instead of {})'.format(field.name, arrays[field.name].type, field.type))
+        if mismatched:
+            raise ValueError('width table columns do not match the types of the first row group written: ' + ', '.join(mismatched))
+        return(pa.RecordBatch.from_arrays([arrays[field.name] for field in self.schema], schema = self.schema))
+
+    def _Flush(self, part, final = True):
+        # // write the buffered rows of a partition as full row groups; the remainder waits for more rows unless final
+        buf = self.buffers.pop(part, [])
+        if not buf:
+            return
+        columns = OrderedDict((k, np.concatenate([b[k] for b in buf])) for k in buf[0])
+        n = len(columns['image_id'])
+        end = n if final else n - n % self.rowGroupSize
+        for start in range(0, end, self.rowGroupSize):
+            chunk = OrderedDict((k, v[start:min(start + self.rowGroupSize, end)]) for k, v in columns.items())
+            self._Write(part, self._Batch(chunk))
+        if end < n:
+            self.buffers[part] = [OrderedDict((k, v[end:]) for k, v in columns.items())]
+
+    def _Write(self, part, batch):
+        import pyarrow as pa
+
+        writer = self.writers.pop(part, None)
+        if writer is None:
+            while len(self.writers) >= self.maxOpenFiles:
+                self.writers.popitem(last = False)[1].close()
+            folder = os.path.join(self.directory, part)
+            os.makedirs(folder, exist_ok = True)
+            k = self.nFiles.get(part, 0)
+            self.nFiles[part] = k + 1
+            path = os.path.join(folder, 'part-{}{}'.format(k, FORMATS[self.fmt]))
+            if self.fmt == 'arrow':
+                writer = pa.ipc.new_file(path, self.schema)
+            else:
+                import pyarrow.parquet as pq
+                writer = pq.ParquetWriter(path, self.schema, compression = self.compression)
+        # // most recently written partitions stay at the end of the open-file queue
+        self.writers[part] = writer
+        writer.write_table(pa.Table.from_batches([batch]))
+
+    def close(self):
+        for part in list(self.buffers):
+            self._Flush(part)
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = OrderedDict()
@@ -0,0 +1,98 @@
+# /* band pipeline: stages declare the bands they consume and produce, so only bands reachable from the outputs are kept */
+import re
+from collections import OrderedDict
+
+class PipelineStage(object):
+    """one step of a BandPipeline
+
+    fn: image -> image with the produced bands added (bands it replaces are listed in both consumes and produces)
+    consumes: band names, or regular expressions starting with '^' (e.g. '^flag.*'), read by fn; names missing from
+    the image (optional bands such as 'dem') are ignored
+    produces: band names added by fn; for a final stage, the one name of the object fn returns instead of an image
+    (e.g. the width table)
+    count: optional function of the result returning a dict of counts for the profiler
+    """
+
+    def __init__(self, name, fn, consumes, produces, count = None, final = False):
+        self.name = name
+        self.fn = fn
+        self.consumes = list(consumes)
+        self.produces = list(produces)
+        self.count = count
+        self.final = final
+
+def _Expand(patterns, names):
+    out = []
+    for p in patterns:
+        if p.startswith('^'):
+            out.extend(n for n in names if re.match(p, n))
+        elif p in names:
+            out.append(p)
+    return(out)
+
+class BandPipeline(object):
+    """run a list of stages lazily: a backward pass from the requested outputs marks the stages whose products are needed
+    (the others are skipped), and after each stage the image is cut down with select(image, names) to the bands a later
+    stage still reads or that were requested, so intermediates are released as soon as their last consumer has run
+
+    select: backend-specific band selection, LocalSelect for functions_local.LocalImage or EeSelect for ee.Image
+    """
+
+    def __init__(self, stages, select):
+        self.stages = list(stages)
+        self.select = select
+
+    def Plan(self, inputs, outputs):
+        """(stage, bands kept after it) for the stages that have to run, given the input band names and requested outputs
+        """
+        available = [list(inputs)]
+        for stage in self.stages:
+            added = [] if stage.final else [p for p in stage.produces if p not in available[-1]]
+            available.append(available[-1] + added)
+
+        needed = set(outputs)
+        active = []
+        for i in range(len(self.stages) - 1, -1, -1):
+            stage = self.stages[i]
+            if needed & set(stage.produces):
+                active.append(i)
+                needed |= set(_Expand(stage.consumes, available[i]))
+        active.reverse()
+
+        plan = []
+        for k, i in enumerate(active):
+            later = set(outputs)
+            for j in active[k + 1:]:
+                later |= set(_Expand(self.stages[j].consumes, available[j]))
+            keep = [n for n in available[i + 1] if n in later]
+            plan.append((self.stages[i], keep))
+        return(plan)
+
+    def Run(self, image, inputs, outputs, profiler = None, labels = None):
+        """run the stages needed for outputs on image (whose bands are inputs); returns a dict of output name -> value,
+        the objects returned by final stages and, for band outputs, the image left after the last stage
+        """
+        from functions_profile import Stage
+
+        result = OrderedDict()
+        for (stage, keep) in self.Plan(inputs, outputs):
+            with Stage(profiler, stage.name, **(labels or {})) as counts:
+                value = stage.fn(image)
+                if stage.count is not None:
+                    counts.update(stage.count(value))
+            if stage.final:
+                result[stage.produces[0]] = value
+            else:
+                image = self.select(value, keep)
+        bandOutputs = [name for name in outputs if name not in result]
+        if bandOutputs:
+            image = self.select(image, bandOutputs)
+        for name in bandOutputs:
+            result[name] = image
+        return(result)
+
+def LocalSelect(image, names):
+    return(image.copy(bands = OrderedDict((n, image.bands[n]) for n in names if n in image.bands)))
+
+def EeSelect(image, names):
+    return(image.select(list(names)))
@@ -0,0 +1,130 @@
+# /* per-stage instrumentation of rwGenSR / rwGenSRLocal: wall time, pixel and feature counts, allocations */
+import json
+import time
+import logging
+from collections import OrderedDict
+
+class StageProfiler(object):
+    """collect one record per stage run
+
+    each record is a dict with the stage name, its labels (e.g. image_id, WATER_METHOD), wall time in seconds,
+    the counts the stage reported (pixels, waterPixels, riverPixels, centerlinePixels, widths) and, with memory = True,
+    the peak bytes allocated during the stage (tracemalloc; local backend only); a failing stage is recorded with its error.
+    records are passed to callback (if any), logged as one JSON line each on the 'rwc.profile' logger, and kept for
+    summary() / writePrometheus()
+
+    with the Earth Engine backend the stages only build the computation graph, so times are client side and no counts are taken
+    """
+
+    def __init__(self, callback = None, memory = False, logger = 'rwc.profile', keep = True):
+        self.callback = callback
+        self.memory = memory
+        self.logger = logging.getLogger(logger) if logger else None
+        self.keep = keep
+        self.records = []
+
+    def stage(self, name, **labels):
+        """context manager timing one stage; the yielded dict takes the counts, e.g. rec['widths'] = n
+        """
+        return(_Stage(self, name, labels))
+
+    def emit(self, record):
+        if self.keep:
+            self.records.append(record)
+        if self.logger is not None:
+            self.logger.info(json.dumps(record, default = str))
+        if self.callback is not None:
+            self.callback(record)
+
+    def summary(self, by = ('stage',)):
+        """per stage (or per combination of the record fields in by, e.g. ('stage', 'image_id')): number of runs,
+        failures, total seconds, summed counts and the largest peak allocation
+        """
+        out = OrderedDict()
+        for rec in self.records:
+            key = tuple((k, rec.get(k)) for k in by)
+            s = out.setdefault(key, OrderedDict([('runs', 0), ('errors', 0), ('seconds', 0.0)]))
+            s['runs'] += 1
+            s['errors'] += 'error' in rec
+            s['seconds'] += rec['seconds']
+            for k, v in rec.get('counts', {}).items():
+                s[k] = s.get(k, 0) + v
+            if rec.get('peakBytes') is not None:
+                s['peakBytes'] = max(s.get('peakBytes', 0), rec['peakBytes'])
+        return(out)
+
+    def prometheusText(self, prefix = 'rwc', by = ('stage',)):
+        """the summary in the Prometheus text exposition format, labelled with the fields in by
+        """
+        lines = []
+        summary = self.summary(by)
+        metrics = [('stage_runs_total', 'counter', 'runs'), ('stage_errors_total', 'counter', 'errors'),
+                   ('stage_seconds_total', 'counter', 'seconds'), ('stage_peak_bytes', 'gauge', 'peakBytes')]
+        counts = sorted(set(k for s in summary.values() for k in s) - set(m[2] for m in metrics))
+        metrics += [('stage_{}_total'.format(_Snake(k)), 'counter', k) for k in counts]
+        for (metric, kind, key) in metrics:
+            lines.append('# TYPE {}_{} {}'.format(prefix, metric, kind))
+            for labels, s in summary.items():
+                if key in s:
+                    text = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels)
+                    lines.append('{}_{}{{{}}} {}'.format(prefix, metric, text, s[key]))
+        return('\n'.join(lines) + '\n')
+
+    def writePrometheus(self, path, prefix = 'rwc', by = ('stage',)):
+        # // written to a temporary file first so a node exporter textfile collector never reads a partial file
+        import os
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(self.prometheusText(prefix, by))
+        os.replace(tmp, path)
+
+def _Snake(name):
+    return(''.join('_' + c.lower() if c.isupper() else c for c in name))
+
+class _Stage(object):
+
+    def __init__(self, profiler, name, labels):
+        self.profiler = profiler
+        self.record = OrderedDict([('stage', name)])
+        self.record.update(labels)
+        self.counts = OrderedDict()
+
+    def __enter__(self):
+        if self.profiler.memory:
+            import tracemalloc
+            self.tracing = tracemalloc.is_tracing()
+            if not self.tracing:
+                tracemalloc.start()
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        return(self.counts)
+
+    def __exit__(self, excType, exc, tb):
+        self.record['seconds'] = time.perf_counter() - self.start
+        if self.profiler.memory:
+            import tracemalloc
+            self.record['peakBytes'] = tracemalloc.get_traced_memory()[1]
+            if not self.tracing:
+                tracemalloc.stop()
+        if self.counts:
+            self.record['counts'] = dict(self.counts)
+        if excType is not None:
+            self.record['error'] = '{}: {}'.format(excType.__name__, exc)
+        self.profiler.emit(self.record)
+        return(False)
+
+class _NoStage(object):
+
+    def __enter__(self):
+        return({})
+
+    def __exit__(self, *exc):
+        return(False)
+
+def Stage(profiler, name, **labels):
+    """profiler.stage(name, **labels), or a context doing nothing if profiler is None
+    """
+    if profiler is None:
+        return(_NoStage())
+    return(profiler.stage(name, **labels))
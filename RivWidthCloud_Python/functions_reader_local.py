@@ -0,0 +1,127 @@
+# /* read Landsat collection 1 SR scenes from local GeoTIFF/COG band files: only the bands a water method needs, only an AOI window */
+import os
+import math
+import calendar
+import numpy as np
+from collections import OrderedDict
+from functions_local import LocalImage, PixelIndices, LonLatToXY
+from functions_landsat_local import SENSOR_BANDS, REQUIRED_BANDS, bns
+
+## file name suffix of each collection 1 SR band
+SR_FILES = dict([('B{}'.format(k), 'sr_band{}'.format(k)) for k in range(1, 8)] + [('pixel_qa', 'pixel_qa')])
+
+def SceneProperties(landsatId):
+    """LANDSAT_ID, WRS_PATH, WRS_ROW and system:time_start (ms, acquisition date at 00:00 UTC) from a collection 1 product id
+    """
+    parts = landsatId.split('_')
+    date = parts[3]
+    timestamp = calendar.timegm((int(date[:4]), int(date[4:6]), int(date[6:8]), 0, 0, 0)) * 1000
+    return({'LANDSAT_ID': landsatId, 'WRS_PATH': int(parts[2][:3]), 'WRS_ROW': int(parts[2][3:]), 'system:time_start': timestamp})
+
+def ReadMTL(path):
+    """sun angles from a level 1 MTL metadata file, as the SOLAR_AZIMUTH_ANGLE and SOLAR_ZENITH_ANGLE scene properties
+    """
+    values = {}
+    with open(path) as f:
+        for line in f:
+            if '=' in line:
+                key, value = [v.strip() for v in line.split('=', 1)]
+                values[key] = value.strip('"')
+    properties = {}
+    if 'SUN_AZIMUTH' in values:
+        properties['SOLAR_AZIMUTH_ANGLE'] = float(values['SUN_AZIMUTH'])
+    if 'SUN_ELEVATION' in values:
+        properties['SOLAR_ZENITH_ANGLE'] = 90.0 - float(values['SUN_ELEVATION'])
+    return(properties)
+
+def PointBounds(lon, lat, radius, crs):
+    """(xmin, ymin, xmax, ymax) in crs of the square around a point, the local counterpart of Point.buffer(radius).bounds()
+    """
+    x, y = LonLatToXY(np.array([lon], dtype = np.float64), np.array([lat], dtype = np.float64), crs)
+    return((float(x[0]) - radius, float(y[0]) - radius, float(x[0]) + radius, float(y[0]) + radius))
+
+def WindowOf(transform, shape, bounds, halo = 0, blockShape = None):
+    """(r0, r1, c0, c1) of the pixels covering bounds (in the crs of transform) plus halo pixels, clipped to shape and,
+    if blockShape (rows, cols) is given, widened to whole blocks so each block of a tiled or striped file is decoded once
+    """
+    nr, nc = shape
+    if bounds is None:
+        return((0, nr, 0, nc))
+    xmin, ymin, xmax, ymax = bounds
+    rows, cols = PixelIndices(transform, [xmin, xmax, xmin, xmax], [ymin, ymin, ymax, ymax])
+    r0 = int(math.floor(np.min(rows))) - halo
+    r1 = int(math.ceil(np.max(rows))) + halo
+    c0 = int(math.floor(np.min(cols))) - halo
+    c1 = int(math.ceil(np.max(cols))) + halo
+    if blockShape is not None:
+        br, bc = blockShape
+        r0, c0 = (r0 // br) * br, (c0 // bc) * bc
+        r1, c1 = -(-r1 // br) * br, -(-c1 // bc) * bc
+    r0, r1 = max(r0, 0), min(r1, nr)
+    c0, c1 = max(c0, 0), min(c1, nc)
+    if r1 <= r0 or c1 <= c0:
+        raise ValueError('bounds do not overlap the scene')
+    return((r0, r1, c0, c1))
+
+class SceneReader(object):
+    """reader of scenes stored as one GeoTIFF (or COG) per band, e.g. LC08_L1TP_022034_20130422_20170310_01_T1_sr_band3.tif
+
+    directory and pattern locate the files ({id}: LANDSAT_ID, {band}: file suffix from SR_FILES); sensor band names
+    are mapped to the standardized names (bn5/bn7/bn8 -> bns) as in merge_collections_std_bandnames_collection1tier1_sr.
+    requires rasterio
+    """
+
+    def __init__(self, directory, pattern = '{id}_{band}.tif', blockAligned = True):
+        self.directory = directory
+        self.pattern = pattern
+        self.blockAligned = blockAligned
+
+    def BandFiles(self, landsatId, bands):
+        """standardized band name -> file path, for the requested bands
+        """
+        sensorBands = dict(zip(bns, SENSOR_BANDS[landsatId[:4]]))
+        return(OrderedDict((b, os.path.join(self.directory, self.pattern.format(id = landsatId, band = SR_FILES[sensorBands[b]]))) for b in bands))
+
+    def Read(self, landsatId, WATER_METHOD = 'Jones2019', bands = None, bounds = None, halo = 0, properties = None):
+        """LocalImage of the bands needed by WATER_METHOD (or the given standardized bands), over the window covering
+        bounds (xmin, ymin, xmax, ymax in the scene crs; None for the whole scene) plus halo pixels
+
+        the footprint excludes the nodata pixels of any band read; properties come from the product id, the MTL file
+        next to the bands if there is one, and properties
+        """
+        import rasterio
+        from rasterio.windows import Window as RioWindow
+
+        if bands is None:
+            bands = REQUIRED_BANDS[WATER_METHOD]
+        files = self.BandFiles(landsatId, bands)
+
+        data = OrderedDict()
+        footprint = None
+        window = transform = crs = None
+        read = {}
+        for (name, path) in files.items():
+            # // Landsat 7 and 5 use one file for uBlue and Blue
+            if path in read:
+                data[name] = read[path]
+                continue
+            with rasterio.open(path) as src:
+                if window is None:
+                    blockShape = src.block_shapes[0] if self.blockAligned else None
+                    window = WindowOf(tuple(src.transform)[:6], (src.height, src.width), bounds, halo, blockShape)
+                    r0, r1, c0, c1 = window
+                    rioWindow = RioWindow(c0, r0, c1 - c0, r1 - r0)
+                    transform = tuple(src.window_transform(rioWindow))[:6]
+                    crs = src.crs.to_string()
+                band = src.read(1, window = rioWindow)
+                if src.nodata is not None:
+                    valid = band != src.nodata
+                    footprint = valid if footprint is None else footprint & valid
+            data[name] = read[path] = band
+
+        props = SceneProperties(landsatId)
+        mtl = os.path.join(self.directory, landsatId + '_MTL.txt')
+        if os.path.exists(mtl):
+            props.update(ReadMTL(mtl))
+        props.update(properties or {})
+        return(LocalImage(data, transform, crs, props, footprint))
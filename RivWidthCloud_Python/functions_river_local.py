@@ -0,0 +1,58 @@
+# /* local (numpy) counterpart of functions_river: functions to extract river mask */
+import numpy as np
+from scipy import ndimage
+from functions_local import PaintLines, PixelCoordinates, XYToLonLat
+from functions_components_local import ConnectedToSeeds, SmallComponents
+
+def GetCenterline(clDataset, bound):
+    # // keep the GRWL centerlines (sequences of lon, lat vertices) whose bounding box overlaps bound = (lonmin, latmin, lonmax, latmax)
+    lonmin, latmin, lonmax, latmax = bound
+    cl = []
+    for line in clDataset:
+        line = np.asarray(line, dtype = np.float64)
+        if (line[:, 0].max() >= lonmin and line[:, 0].min() <= lonmax and
+            line[:, 1].max() >= latmin and line[:, 1].min() <= latmax):
+            cl.append(line)
+    return(cl)
+
+def ExtractChannel(image, centerline, maxDistance, footprint, transform, crs, scale, connectivity = 8):
+    # // extract the channel water bodies from the water mask, based on connectivity to the reference centerline.
+    # // centerline: lon, lat polylines, or a boolean raster of them already painted on the image grid
+    water = (image == 1) & footprint
+    if not (isinstance(centerline, np.ndarray) and centerline.shape == image.shape):
+        centerline = PaintLines(centerline, image.shape, transform, crs)
+    source = centerline & water #// only use the centerline that overlaps with the water mask
+
+    connectedToCl = ConnectedToSeeds(water, source, connectivity)
+
+    # // like cumulativeCost, the search does not extend beyond maxDistance from the centerline
+    if source.any():
+        connectedToCl &= ndimage.distance_transform_edt(~source) * scale <= maxDistance
+
+    channel = connectedToCl.astype(np.uint8)
+    return(channel)
+
+def RemoveIsland(channel, FILL_SIZE, footprint, connectivity = 8):
+    # /* fill in island as water if the size (number of pixels) of the island is smaller than FILL_SIZE */
+    # // sizes are exact, so FILL_SIZE is not limited to the 1024 pixels of connectedPixelCount
+    fill = SmallComponents((channel == 0) & footprint, FILL_SIZE, connectivity)
+    river = channel.copy()
+    river[fill] = 1
+    return(river)
+
+def ExtractRiver(imgIn, clData, maxDist, minIslandRemoval, connectivity = 8):
+    # // clData: sequence of GRWL centerlines, a functions_grwl_local.GrwlIndex, or GRWL already painted on the image grid
+    waterMask = imgIn.band('waterMask')
+    if isinstance(clData, np.ndarray):
+        cl = clData
+    elif hasattr(clData, 'PaintImage'):
+        cl = clData.PaintImage(imgIn)
+    else:
+        nr, nc = waterMask.shape
+        x, y = PixelCoordinates(imgIn.transform, [0, 0, nr - 1, nr - 1], [0, nc - 1, 0, nc - 1])
+        lon, lat = XYToLonLat(x, y, imgIn.crs)
+        bound = (np.min(lon), np.min(lat), np.max(lon), np.max(lat))
+        cl = GetCenterline(clData, bound)
+    channelMask = ExtractChannel(waterMask, cl, maxDist, imgIn.footprint, imgIn.transform, imgIn.crs, imgIn.get('scale'), connectivity)
+    riverMask = RemoveIsland(channelMask, minIslandRemoval, imgIn.footprint, connectivity)
+    return(imgIn.addBands({'channelMask': channelMask, 'riverMask': riverMask}))
@@ -0,0 +1,49 @@
+# /* split a local scene into overlapping tiles and stitch the width tables back together */
+import math
+import numpy as np
+from collections import OrderedDict
+
+def TileHalo(scale, maxDistance, fillSize, neighborhoodSize = 256, hillShadowDistance = 0):
+    """overlap (pixels) around a tile core covering the reach of each stage measured in straight-line distance:
+    - ExtractChannel: GRWL pixels within maxDistance (meters) of a water pixel
+    - RemoveIsland: the extent of a compact (disk-shaped) island of fillSize pixels
+    - CalcDistanceMap: distances up to neighborhoodSize pixels; cross sections then reach 1.5 times further, plus the 30 m end buffers
+    - CalcHillShadowSR: rays towards the sun up to hillShadowDistance (meters)
+
+    this is not a guarantee that a tile sees the same neighbourhood as the full scene: water connected to GRWL only
+    through a path leaving the halo, or an elongated island extending beyond it, can still be classified differently
+    near the tile edge. neighborhoodSize must be finite, since an uncapped distance map has no bounded reach
+    """
+    if neighborhoodSize is None:
+        raise ValueError('tiled processing needs a finite distance cap (neighborhoodSize / DISTANCE_CAP, in pixels) to bound the tile overlap')
+    halo = max(
+        math.ceil(maxDistance / scale),
+        math.ceil(2 * math.sqrt(fillSize / math.pi)),
+        math.ceil(1.5 * neighborhoodSize + 30.0 / scale),
+        math.ceil(hillShadowDistance / scale))
+    return(int(halo) + 2)
+
+def TileWindows(shape, tileSize, halo):
+    """list of (window, core) where window = (r0, r1, c0, c1) is the area read for a tile and core, in window coordinates,
+    the part of it whose centerline pixels the tile reports; the cores partition the scene so overlaps are never reported twice
+    """
+    nr, nc = shape
+    tiles = []
+    for r in range(0, nr, tileSize):
+        for c in range(0, nc, tileSize):
+            r0, r1 = max(r - halo, 0), min(r + tileSize + halo, nr)
+            c0, c1 = max(c - halo, 0), min(c + tileSize + halo, nc)
+            core = (r - r0, min(r + tileSize, nr) - r0, c - c0, min(c + tileSize, nc) - c0)
+            tiles.append(((r0, r1, c0, c1), core))
+    return(tiles)
+
+def CoreMask(shape, core):
+    mask = np.zeros(shape, dtype = bool)
+    mask[core[0]:core[1], core[2]:core[3]] = True
+    return(mask)
+
+def ConcatTables(tables):
+    tables = [t for t in tables if t is not None]
+    if not tables:
+        return(OrderedDict())
+    return(OrderedDict((k, np.concatenate([t[k] for t in tables])) for k in tables[0]))
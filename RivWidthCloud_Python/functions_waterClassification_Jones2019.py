@@ -2,6 +2,7 @@
 # see https://github.com/USGS-EROS/espa-surface-water-extent/blob/master/dswe/algorithm-description.md
 # */
 import ee
+from functions_waterClassification_Jones2019_table import DsweLookupTable
 
 def Mndwi(image):
     return(image.normalizedDifference(['Green', 'Swir1']).rename('mndwi'))
@@ -15,11 +16,13 @@ def Mbsrn(image):
 def Ndvi(image):
     return(image.normalizedDifference(['Nir', 'Red']).rename('ndvi'))
 
-def Awesh(image):
+def Awesh(image, mbsrn = None):
+    if mbsrn is None:
+        mbsrn = Mbsrn(image)
     return(image.expression('Blue + 2.5 * Green + (-1.5) * mbsrn + (-0.25) * Swir2', {
     'Blue': image.select(['Blue']),
     'Green': image.select(['Green']),
-    'mbsrn': Mbsrn(image).select(['mbsrn']),
+    'mbsrn': mbsrn.select(['mbsrn']),
     'Swir2': image.select(['Swir2'])}))
 
 def Dswe(i):
@@ -89,7 +92,42 @@ def Dswe(i):
 
     return(iDswe.rename(['dswe']))
 
+def DsweLUT(i):
+    """same result as Dswe: the five tests are packed into a 5-bit index and mapped to the class with a single remap
+    """
+    mndwi = Mndwi(i)
+    mbsrn = Mbsrn(i)
+    awesh = Awesh(i, mbsrn)
+    ndvi = Ndvi(i)
+    swir1 = i.select(['Swir1'])
+    nir = i.select(['Nir'])
+    blue = i.select(['Blue'])
+    swir2 = i.select(['Swir2'])
+
+    t1 = mndwi.gt(0.124)
+    t2 = Mbsrv(i).gt(mbsrn)
+    t3 = awesh.gt(0)
+    t4 = (mndwi.gt(-0.44)
+    .And(swir1.lt(900))
+    .And(nir.lt(1500))
+    .And(ndvi.lt(0.7)))
+    t5 = (mndwi.gt(-0.5)
+    .And(blue.lt(1000))
+    .And(swir1.lt(3000))
+    .And(swir2.lt(1000))
+    .And(nir.lt(2500)))
+
+    t = (t1
+    .bitwiseOr(t2.leftShift(1))
+    .bitwiseOr(t3.leftShift(2))
+    .bitwiseOr(t4.leftShift(3))
+    .bitwiseOr(t5.leftShift(4)))
+
+    iDswe = t.remap(list(range(32)), DsweLookupTable())
+
+    return(iDswe.rename(['dswe']))
+
 def ClassifyWaterJones2019(img):
-    dswe = Dswe(img)
+    dswe = DsweLUT(img)
     waterMask = dswe.eq(1).Or(dswe.eq(2)).rename(['waterMask'])
     return(waterMask)
@@ -0,0 +1,92 @@
+# /* local (numpy) counterpart of functions_waterClassification_Jones2019
+# see https://github.com/USGS-EROS/espa-surface-water-extent/blob/master/dswe/algorithm-description.md
+# */
+import numpy as np
+from functions_waterClassification_Jones2019_table import DsweLookupTable
+
+def NormalizedDifference(a, b):
+    a = a.astype(np.float64)
+    b = b.astype(np.float64)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        return((a - b) / (a + b))
+
+def Mndwi(image):
+    return(NormalizedDifference(image.band('Green'), image.band('Swir1')))
+
+def Mbsrv(image):
+    return(image.band('Green').astype(np.float64) + image.band('Red'))
+
+def Mbsrn(image):
+    return(image.band('Nir').astype(np.float64) + image.band('Swir1'))
+
+def Ndvi(image):
+    return(NormalizedDifference(image.band('Nir'), image.band('Red')))
+
+def Awesh(image, mbsrn = None):
+    if mbsrn is None:
+        mbsrn = Mbsrn(image)
+    return(image.band('Blue') + 2.5 * image.band('Green') + (-1.5) * mbsrn + (-0.25) * image.band('Swir2'))
+
+def Dswe(i):
+    mndwi = Mndwi(i)
+    mbsrv = Mbsrv(i)
+    mbsrn = Mbsrn(i)
+    awesh = Awesh(i)
+    swir1 = i.band('Swir1')
+    nir = i.band('Nir')
+    ndvi = Ndvi(i)
+    blue = i.band('Blue')
+    swir2 = i.band('Swir2')
+
+    t1 = mndwi > 0.124
+    t2 = mbsrv > mbsrn
+    t3 = awesh > 0
+    t4 = (mndwi > -0.44) & (swir1 < 900) & (nir < 1500) & (ndvi < 0.7)
+    t5 = (mndwi > -0.5) & (blue < 1000) & (swir1 < 3000) & (swir2 < 1000) & (nir < 2500)
+
+    t = t1 * 1 + t2 * 10 + t3 * 100 + t4 * 1000 + t5 * 10000
+
+    noWater = np.isin(t, [0, 1, 10, 100, 1000])
+    hWater = np.isin(t, [1111, 10111, 11011, 11101, 11110, 11111])
+    mWater = np.isin(t, [111, 1011, 1101, 1110, 10011, 10101, 10110, 11001, 11010, 11100])
+    pWetland = t == 11000
+    lWater = np.isin(t, [11, 101, 110, 1001, 1010, 1100, 10000, 10001, 10010, 10100])
+
+    iDswe = noWater * 0 + hWater * 1 + mWater * 2 + pWetland * 3 + lWater * 4
+
+    return(iDswe.astype(np.uint8))
+
+DSWE_LUT = np.array(DsweLookupTable(), dtype = np.uint8)
+
+def DsweIndex(i):
+    """pack the five DSWE tests into a 5-bit index, computing each spectral index once
+    """
+    green = i.band('Green').astype(np.float64)
+    red = i.band('Red').astype(np.float64)
+    nir = i.band('Nir').astype(np.float64)
+    swir1 = i.band('Swir1').astype(np.float64)
+    swir2 = i.band('Swir2')
+    blue = i.band('Blue')
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        mndwi = (green - swir1) / (green + swir1)
+        ndvi = (nir - red) / (nir + red)
+    mbsrn = nir + swir1
+    awesh = blue + 2.5 * green + (-1.5) * mbsrn + (-0.25) * swir2
+
+    t = (mndwi > 0.124).astype(np.uint8)
+    t |= (green + red > mbsrn).astype(np.uint8) << 1
+    t |= (awesh > 0).astype(np.uint8) << 2
+    t |= ((mndwi > -0.44) & (swir1 < 900) & (nir < 1500) & (ndvi < 0.7)).astype(np.uint8) << 3
+    t |= ((mndwi > -0.5) & (blue < 1000) & (swir1 < 3000) & (swir2 < 1000) & (nir < 2500)).astype(np.uint8) << 4
+    return(t)
+
+def DsweLUT(i):
+    """same result as Dswe, using one table lookup instead of the chained code comparisons
+    """
+    return(np.take(DSWE_LUT, DsweIndex(i)))
+
+def ClassifyWaterJones2019(img):
+    dswe = DsweLUT(img)
+    waterMask = (dswe == 1) | (dswe == 2)
+    return(waterMask.astype(np.uint8))
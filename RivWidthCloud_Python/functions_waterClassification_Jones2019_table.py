@@ -0,0 +1,19 @@
+# /* DSWE class table shared by functions_waterClassification_Jones2019 (Earth Engine) and its local (numpy) counterpart */
+
+# // decimal test codes (t1 + 10 * t2 + 100 * t3 + 1000 * t4 + 10000 * t5) of each DSWE class used in Dswe
+DSWE_CODES = {
+    0: [0, 1, 10, 100, 1000],
+    1: [1111, 10111, 11011, 11101, 11110, 11111],
+    2: [111, 1011, 1101, 1110, 10011, 10101, 10110, 11001, 11010, 11100],
+    3: [11000],
+    4: [11, 101, 110, 1001, 1010, 1100, 10000, 10001, 10010, 10100]}
+
+def DsweLookupTable():
+    """32-entry table mapping the 5-bit test index (t1 + 2 * t2 + 4 * t3 + 8 * t4 + 16 * t5) to the DSWE class
+    """
+    classOfCode = dict((code, c) for c in DSWE_CODES for code in DSWE_CODES[c])
+    lut = []
+    for index in range(32):
+        code = sum(((index >> bit) & 1) * 10 ** bit for bit in range(5))
+        lut.append(classOfCode.get(code, 0))
+    return(lut)
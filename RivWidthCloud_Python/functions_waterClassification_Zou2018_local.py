@@ -0,0 +1,34 @@
+import numpy as np
+
+def Ndvi(image):
+    # // calculate ndvi
+    nir = image.band('Nir').astype(np.float64)
+    red = image.band('Red').astype(np.float64)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        ndvi = (nir - red) / (nir + red)
+    return ndvi
+
+def Evi(image):
+    # calculate the enhanced vegetation index
+    nir = image.band('Nir').astype(np.float64)
+    red = image.band('Red').astype(np.float64)
+    blue = image.band('Blue').astype(np.float64)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        evi = 2.5 * (nir - red) / (1 + nir + 6 * red - 7.5 * blue)
+    return evi
+
+def Mndwi(image):
+    # calculate mndwi
+    green = image.band('Green').astype(np.float64)
+    swir1 = image.band('Swir1').astype(np.float64)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        mndwi = (green - swir1) / (green + swir1)
+    return mndwi
+
+def ClassifyWaterZou2018(image):
+    mndwi = Mndwi(image)
+    ndvi = Ndvi(image)
+    evi = Evi(image)
+
+    water = ((mndwi > ndvi) | (mndwi > evi)) & (evi < 0.1)
+    return(water.astype(np.uint8))
@@ -1,28 +1,42 @@
 
 import ee
 
-def rwGenSR(aoi = None, WATER_METHOD = 'Jones2019', MAXDISTANCE = 4000, FILL_SIZE = 333, MAXDISTANCE_BRANCH_REMOVAL = 500):
+def rwGenSR(aoi = None, WATER_METHOD = 'Jones2019', MAXDISTANCE = 4000, FILL_SIZE = 333, MAXDISTANCE_BRANCH_REMOVAL = 500, profiler = None):
+    """profiler: optional functions_profile.StageProfiler timing each stage (graph construction only, on Earth Engine)
+    """
 
     grwl = ee.FeatureCollection("users/eeProject/grwl")
-    from functions_landsat import CalculateWaterAddFlagsSR
+    from functions_landsat import CalculateWaterAddFlagsSR, bns, FLAG_BANDS
     from functions_river import ExtractRiver
     from functions_centerline_width import CalculateCenterline, CalculateOrthAngle, CalculateWidth
+    from functions_pipeline import PipelineStage, BandPipeline, EeSelect
 
-    # // generate function based on user choice
-    def tempFUN(image, aoi = aoi):
-        aoi = ee.Algorithms.If(aoi, aoi, image.geometry())
-        image = image.clip(aoi)
+    labels = {'WATER_METHOD': WATER_METHOD, 'MAXDISTANCE': MAXDISTANCE, 'FILL_SIZE': FILL_SIZE}
 
+    # // each stage declares the bands it reads and adds; bands no later stage reads are dropped from the graph
+    pipeline = BandPipeline([
         # // derive water mask and masks for flags
-        imgOut = CalculateWaterAddFlagsSR(image, WATER_METHOD)
+        PipelineStage('CalculateWaterAddFlagsSR', lambda image: CalculateWaterAddFlagsSR(image, WATER_METHOD),
+            bns, ['waterMask', 'fmask', 'flag_hillshadow'] + [name for (name, c) in FLAG_BANDS]),
         # // calculate river mask
-        imgOut = ExtractRiver(imgOut, grwl, MAXDISTANCE, FILL_SIZE)
+        PipelineStage('ExtractRiver', lambda image: ExtractRiver(image, grwl, MAXDISTANCE, FILL_SIZE),
+            ['waterMask'], ['channelMask', 'riverMask']),
         # // calculate centerline
-        imgOut = CalculateCenterline(imgOut)
+        PipelineStage('CalculateCenterline', CalculateCenterline,
+            ['riverMask'], ['cleanedCL', 'rawCL', 'gradientMap', 'distanceMap']),
         # // calculate orthogonal direction of the centerline
-        imgOut = CalculateOrthAngle(imgOut)
+        PipelineStage('CalculateOrthAngle', CalculateOrthAngle, ['cleanedCL'], ['orthDegree']),
         # // export widths
-        widthOut = CalculateWidth(imgOut)
+        PipelineStage('CalculateWidth', CalculateWidth,
+            ['riverMask', 'channelMask', '^flag.*', 'orthDegree', 'distanceMap'], ['widths'], final = True)],
+        EeSelect)
+
+    # // generate function based on user choice
+    def tempFUN(image, aoi = aoi):
+        aoi = ee.Algorithms.If(aoi, aoi, image.geometry())
+        image = image.clip(aoi)
+
+        widthOut = pipeline.Run(image, bns, ['widths'], profiler, labels)['widths']
 
         return(widthOut)
 
@@ -1,13 +1,12 @@
 if __name__ == '__main__':
 
-    # import ee
+    import ee
     import numpy as np
     import pandas as pd
     import getopt
-    import os
-    from os import listdir
     import argparse
-    from functions_batch import maximum_no_of_tasks
+    from functions_batch import run_batch, chunk_size, point_sites, TaskTracker, JobLedger, param_hash
+    from rwc_landsat import rwGenSR
 
 
     parser = argparse.ArgumentParser(prog = 'rwc_landsat_batch.py', description = "Batch execute rwc_landsat.py for a csv files that contains Landsat image IDs and/or point locations.\
@@ -20,6 +19,10 @@ if __name__ == '__main__':
     parser.add_argument('-b', '--MAXDISTANCE_BRANCH_REMOVAL', help = 'Default: 500 pixels', type = float, default = 500)
     parser.add_argument('-o', '--OUTPUT_FOLDER', help = 'Any existing folder name in Google Drive. Default: root of Google Drive', type = str, default = '')
     parser.add_argument('-m', '--MAXIMUM_NO_OF_TASKS', help = 'Maximum number of tasks running simutaneously on the server. Default: 6', type = int, default = 6)
+    parser.add_argument('-c', '--CONCURRENCY', help = 'Number of scenes whose tasks are built and submitted concurrently. Default: 4', type = int, default = 4)
+    parser.add_argument('-l', '--LEDGER', help = 'SQLite file recording submitted, finished and failed scenes. Finished scenes are skipped when the batch is rerun. Default: rwc_ledger.sqlite', type = str, default = 'rwc_ledger.sqlite')
+    parser.add_argument('-a', '--MAX_ATTEMPTS', help = 'Maximum number of submissions of a scene that keeps failing. Default: 3', type = int, default = 3)
+    parser.add_argument('-k', '--CHUNK_SIZE', help = 'Number of scenes exported by one task, whose widths are written to one file with an "export_prefix" column. 0: chosen from the number of scenes and the area processed per scene. Default: 1 (one task per scene)', type = int, default = 1)
     parser.add_argument('-s', '--START_NO', help = '(Re)starting task No. Helpful when restarting an interrupted batch processing. Default: 0 (start from the beginning)', type = int, default = 0)
 
     group_validation = parser.add_argument_group(title = 'Batch run the RivWidthCloud in POINT mode',
@@ -29,6 +32,7 @@ if __name__ == '__main__':
 
     group_validation.add_argument('-p', '--POINT', help = 'Enable the POINT mode', action = 'store_true')
     group_validation.add_argument('-r', '--BUFFER', help = 'Radius of the buffered region around the point location', type = float, default = 4000)
+    group_validation.add_argument('-g', '--GROUP', help = 'Process each scene once for all of its points: widths over the union of the buffered regions are assigned to the points whose region contains them, and exported as one file per scene (<LANDSAT_ID>_v_points) with a "Point_ID" column', action = 'store_true')
 
     args = parser.parse_args()
 
@@ -41,9 +45,14 @@ if __name__ == '__main__':
     OUTPUT_FOLDER = args.OUTPUT_FOLDER
     MAXIMUM_NO_OF_TASKS= args.MAXIMUM_NO_OF_TASKS
     START_NO = args.START_NO
+    CONCURRENCY = args.CONCURRENCY
+    LEDGER = args.LEDGER
+    MAX_ATTEMPTS = args.MAX_ATTEMPTS
+    CHUNK_SIZE = args.CHUNK_SIZE
 
     POINTMODE = args.POINT
     RADIUS = args.BUFFER
+    GROUP = args.GROUP
 
     if not POINTMODE:
         imageInfo = pd.read_csv(ID_FILE, dtype = {'LANDSAT_ID': np.unicode_})
@@ -64,19 +73,48 @@ if __name__ == '__main__':
     print('')
     print('Number of images in the file:', N)
 
-    for n in range(START_NO, N):
-
-        cmdstr = 'python rwc_landsat_one_image.py ' +  sceneIDList[n] + ' -f ' + FORMAT + ' -w ' + WATER_METHOD
-        cmdstr = cmdstr + ' -d ' + str(MAXDISTANCE) + ' -i ' + str(FILL_SIZE) + ' -b ' + str(MAXDISTANCE_BRANCH_REMOVAL)
-
-        if OUTPUT_FOLDER:
-            cmdstr = cmdstr + ' -o ' + OUTPUT_FOLDER
-
-        if POINTMODE:
-            cmdstr = cmdstr + ' -p -x ' + str(x[n]) + ' -y ' + str(y[n]) + ' -r ' + str(RADIUS) + ' -n ' + point_IDList[n]
-
-        os.system(cmdstr)
-
-        maximum_no_of_tasks(MAXIMUM_NO_OF_TASKS, 30)
-
-        print('submitted task ', n + 1, ' of ', N)
+    # initialize once and build the pipeline once for every scene in the file
+    ee.Initialize()
+    rwc = rwGenSR(WATER_METHOD = WATER_METHOD, MAXDISTANCE = MAXDISTANCE, FILL_SIZE = FILL_SIZE, MAXDISTANCE_BRANCH_REMOVAL = MAXDISTANCE_BRANCH_REMOVAL)
+
+    ledger = JobLedger(LEDGER)
+    tracker = TaskTracker(MAXIMUM_NO_OF_TASKS, onFinish = ledger.finished)
+    # tasks left running by an earlier run still count towards the maximum number of tasks
+    for taskId in ledger.reconcile():
+        tracker.track(taskId)
+
+    params = {'WATER_METHOD': WATER_METHOD, 'MAXDISTANCE': MAXDISTANCE, 'FILL_SIZE': FILL_SIZE, 'MAXDISTANCE_BRANCH_REMOVAL': MAXDISTANCE_BRANCH_REMOVAL}
+
+    jobs = []
+    aoiArea = (2 * RADIUS) ** 2 if POINTMODE else None
+    if POINTMODE and GROUP:
+        # // one job per scene, with the points of its rows in the order they appear
+        groups = {}
+        for n in range(START_NO, N):
+            groups.setdefault(sceneIDList[n], []).append((point_IDList[n], x[n], y[n]))
+        for (sceneID, points) in groups.items():
+            hashN = param_hash(dict(params, POINTS = points, BUFFER = RADIUS))
+            if ledger.should_run(sceneID, hashN, MAX_ATTEMPTS):
+                jobs.append((sceneID, sceneID + '_v_points', point_sites(points, RADIUS), hashN))
+        print('Number of images with points:', len(groups))
+        print('Number of images skipped (finished, in progress, or out of retries):', len(groups) - len(jobs))
+        aoiArea = aoiArea * (N - START_NO) / max(len(groups), 1)
+    else:
+        for n in range(START_NO, N):
+            if POINTMODE:
+                hashN = param_hash(dict(params, Point_ID = point_IDList[n], Longitude = x[n], Latitude = y[n], BUFFER = RADIUS))
+                if ledger.should_run(sceneIDList[n], hashN, MAX_ATTEMPTS):
+                    aoi = ee.Geometry.Point([x[n], y[n]], "EPSG:4326").buffer(RADIUS).bounds()
+                    jobs.append((sceneIDList[n], sceneIDList[n] + '_v_' + point_IDList[n], aoi, hashN))
+            else:
+                hashN = param_hash(params)
+                if ledger.should_run(sceneIDList[n], hashN, MAX_ATTEMPTS):
+                    jobs.append((sceneIDList[n], sceneIDList[n], None, hashN))
+        print('Number of images skipped (finished, in progress, or out of retries):', N - START_NO - len(jobs))
+
+    if CHUNK_SIZE == 0:
+        CHUNK_SIZE = chunk_size(len(jobs), MAXIMUM_NO_OF_TASKS, aoiArea)
+    if CHUNK_SIZE > 1:
+        print('Number of scenes exported per task:', CHUNK_SIZE)
+
+    run_batch(jobs, rwc, OUTPUT_FOLDER, FORMAT, CONCURRENCY, tracker, ledger, CHUNK_SIZE)
@@ -0,0 +1,208 @@
+import numpy as np
+
+def rwGenSRLocal(aoi = None, WATER_METHOD = 'Jones2019', MAXDISTANCE = 4000, FILL_SIZE = 333, MAXDISTANCE_BRANCH_REMOVAL = 500, grwl = None, DISTANCE_CAP = None, dem = None, profiler = None):
+    """local (numpy) counterpart of rwc_landsat.rwGenSR
+
+    the returned function takes a functions_local.LocalImage holding the standardized Landsat SR bands
+    (see functions_landsat.merge_collections_std_bandnames_collection1tier1_sr), optionally a 'dem' band on the same grid,
+    and the scene properties (LANDSAT_ID, system:time_start, SOLAR_AZIMUTH_ANGLE, SOLAR_ZENITH_ANGLE).
+    aoi: (xmin, ymin, xmax, ymax) in the scene crs
+    grwl: sequence of GRWL centerlines, each an (N, 2) array of lon, lat vertices, or a functions_grwl_local.GrwlIndex
+    (e.g. GrwlIndex.FromFile('GRWL.gpkg')) which rasterizes only the segments overlapping the scene and caches them per WRS-2 tile
+    DISTANCE_CAP: distance-to-bank limit (pixels) of the distance map; None (default) measures any river width exactly,
+    256 reproduces the fastDistanceTransform neighborhood of the Earth Engine version
+    dem: functions_dem_local.DemProvider; its tile caches are reused across the scenes processed by the returned function
+    profiler: functions_profile.StageProfiler recording each stage of each scene
+    """
+
+    from functions_local import ClipToBounds
+
+    if grwl is None:
+        grwl = []
+
+    # // generate function based on user choice
+    def tempFUN(image, aoi = aoi):
+        if aoi is not None:
+            image = ClipToBounds(image, aoi)
+
+        return(RunStages(image, WATER_METHOD, MAXDISTANCE, FILL_SIZE, grwl, distanceCap = DISTANCE_CAP, dem = dem, profiler = profiler))
+
+    return(tempFUN)
+
+def RunStages(image, WATER_METHOD, MAXDISTANCE, FILL_SIZE, grwl, core = None, distanceCap = None, dem = None, static = None, incremental = None, profiler = None, outputs = None):
+    """run the rwGenSR stages on one LocalImage; if core is given (r0, r1, c0, c1), only widths of centerline pixels inside it are reported
+    static: inputs precomputed for the image grid by StaticInputs, used instead of grwl and the DEM tiles where present
+    incremental: functions_incremental_local.IncrementalCenterline updating the centerline of the previous scene on the grid
+    profiler: functions_profile.StageProfiler recording time, pixel and feature counts (and allocations) of each stage
+    outputs: None for the width table, or a list of 'widths' and band names (e.g. ['riverMask', 'cleanedCL']), returned as a
+    dict of 'widths' -> table and band name -> LocalImage holding the requested bands; only the stages these depend on are run
+
+    the stages run as a functions_pipeline.BandPipeline, so a band is dropped as soon as the last stage reading it is done
+    """
+    from functions_landsat_local import CalculateWaterAddFlagsSR, REQUIRED_BANDS, FLAG_BANDS
+    from functions_river_local import ExtractRiver
+    from functions_centerline_width_local import CalculateCenterline, CalculateOrthAngle, CalculateWidth
+    from functions_pipeline import PipelineStage, BandPipeline, LocalSelect
+
+    labels = {'image_id': image.get('LANDSAT_ID'), 'WATER_METHOD': WATER_METHOD, 'MAXDISTANCE': MAXDISTANCE, 'FILL_SIZE': FILL_SIZE}
+    pixels = int(np.prod(image.shape))
+
+    lonLat = None
+    if static is not None:
+        if static['grid'] != GridKey(image):
+            raise ValueError('image {} is not on the grid of the static inputs'.format(image.get('LANDSAT_ID')))
+        grwl = static['centerline']
+        lonLat = static['lonLat']
+        if 'dem' in static and 'dem' not in image.bands:
+            image = image.addBands({'dem': static['dem']})
+
+    def Count(band, key, total = True):
+        def fn(img):
+            counts = {'pixels': pixels} if total else {}
+            counts[key] = int(np.count_nonzero(img.band(band)))
+            return(counts)
+        return(fn)
+
+    centerlineBands = ['cleanedCL', 'rawCL', 'gradientMap', 'distanceMap']
+    stages = [
+        # // derive water mask and masks for flags
+        PipelineStage('CalculateWaterAddFlagsSR', lambda img: CalculateWaterAddFlagsSR(img, WATER_METHOD, dem, lonLat),
+            REQUIRED_BANDS[WATER_METHOD] + ['BQA', 'dem'],
+            ['waterMask', 'fmask', 'flag_hillshadow'] + [name for (name, c) in FLAG_BANDS] + ['dem'],
+            Count('waterMask', 'waterPixels')),
+        # // calculate river mask
+        PipelineStage('ExtractRiver', lambda img: ExtractRiver(img, grwl, MAXDISTANCE, FILL_SIZE),
+            ['waterMask'], ['channelMask', 'riverMask'], Count('riverMask', 'riverPixels'))]
+    if incremental is not None:
+        # // centerline and orthogonal direction, recomputed only where the river mask changed
+        stages.append(PipelineStage('IncrementalCenterline', incremental.Update,
+            ['riverMask'], centerlineBands + ['orthDegree'], Count('cleanedCL', 'centerlinePixels', False)))
+    else:
+        stages += [
+            # // calculate centerline
+            PipelineStage('CalculateCenterline', lambda img: CalculateCenterline(img, distanceCap),
+                ['riverMask'], centerlineBands, Count('cleanedCL', 'centerlinePixels')),
+            # // calculate orthogonal direction of the centerline
+            PipelineStage('CalculateOrthAngle', CalculateOrthAngle,
+                ['cleanedCL'], ['orthDegree'], Count('cleanedCL', 'centerlinePixels', False))]
+    if core is not None:
+        from functions_tile_local import CoreMask
+        stages.append(PipelineStage('CoreMask',
+            lambda img: img.addBands({'orthDegree': np.where(CoreMask(img.shape, core), img.band('orthDegree'), np.nan)}),
+            ['orthDegree'], ['orthDegree']))
+    # // export widths
+    stages.append(PipelineStage('CalculateWidth', lambda img: CalculateWidth(img, lonLat),
+        ['riverMask', 'channelMask', '^flag.*', 'dem', 'orthDegree', 'distanceMap'], ['widths'],
+        lambda widths: {'widths': len(widths['width'])}, final = True))
+
+    pipeline = BandPipeline(stages, LocalSelect)
+    result = pipeline.Run(image, image.bandNames(), ['widths'] if outputs is None else list(outputs), profiler, labels)
+    if outputs is None:
+        return(result['widths'])
+    return(result)
+
+def GridKey(image):
+    return((image.shape, tuple(image.transform[:6]), str(image.crs)))
+
+def StaticInputs(image, grwl, dem = None):
+    """inputs that only depend on the grid of image, computed once for a time series of scenes on that grid:
+    GRWL painted on the grid, elevation (if a DemProvider is given) and the lon, lat of every pixel center, which
+    locate the DEM tiles of the per-scene hill shadow and the centerline points of the width table
+    """
+    from functions_local import PaintLines, PixelLonLat
+
+    static = {'grid': GridKey(image)}
+    if hasattr(grwl, 'Paint'):
+        static['centerline'] = grwl.Paint(image.shape, image.transform, image.crs)
+    else:
+        static['centerline'] = PaintLines(grwl, image.shape, image.transform, image.crs)
+    static['lonLat'] = PixelLonLat(image.shape, image.transform, image.crs)
+    if dem is not None:
+        from functions_dem_local import DemOnGrid
+        static['dem'] = DemOnGrid(dem, image.shape, image.transform, image.crs, static['lonLat'])
+    return(static)
+
+def rwGenSRLocalSeries(aoi = None, WATER_METHOD = 'Jones2019', MAXDISTANCE = 4000, FILL_SIZE = 333, MAXDISTANCE_BRANCH_REMOVAL = 500, grwl = None, DISTANCE_CAP = None, dem = None, INCREMENTAL = False, profiler = None):
+    """time-series variant of rwGenSRLocal for a stack of scenes on one grid (e.g. the acquisitions of one WRS-2 path/row)
+
+    the returned function takes a sequence of LocalImages and yields one width table per image, in order. the GRWL raster,
+    elevation and lon, lat grids are computed from the first (clipped) image and reused, so only the per-date stages
+    (water classification, river mask, centerline, widths) run for each scene; scenes on another grid raise a ValueError.
+    with INCREMENTAL, the centerline of each scene is updated from the previous one only where the river mask changed
+    (see functions_incremental_local.IncrementalCenterline), with the same result
+    """
+
+    from functions_local import ClipToBounds
+
+    if grwl is None:
+        grwl = []
+
+    def tempFUN(images, aoi = aoi):
+        static = None
+        incremental = None
+        if INCREMENTAL:
+            from functions_incremental_local import IncrementalCenterline
+            incremental = IncrementalCenterline(DISTANCE_CAP)
+        for image in images:
+            if aoi is not None:
+                image = ClipToBounds(image, aoi)
+            if static is None:
+                static = StaticInputs(image, grwl, dem)
+
+            yield(RunStages(image, WATER_METHOD, MAXDISTANCE, FILL_SIZE, grwl, distanceCap = DISTANCE_CAP, dem = dem, static = static, incremental = incremental, profiler = profiler))
+
+    return(tempFUN)
+
+def _RunTile(args):
+    image, core, WATER_METHOD, MAXDISTANCE, FILL_SIZE, grwl, distanceCap, dem = args
+    return(RunStages(image, WATER_METHOD, MAXDISTANCE, FILL_SIZE, grwl, core, distanceCap, dem))
+
+def rwGenSRLocalTiled(aoi = None, WATER_METHOD = 'Jones2019', MAXDISTANCE = 4000, FILL_SIZE = 333, MAXDISTANCE_BRANCH_REMOVAL = 500, grwl = None, TILE_SIZE = 1024, N_WORKERS = 1, DISTANCE_CAP = 256, dem = None):
+    """tiled variant of rwGenSRLocal for full scenes or large AOIs
+
+    the scene is split into TILE_SIZE x TILE_SIZE cores, each read with an overlap (see functions_tile_local.TileHalo) and run
+    through all stages on its own, so peak memory is bounded by the tile size instead of the scene size.
+    tiles are spread over N_WORKERS processes; each centerline pixel is reported by the one tile whose core contains it.
+    the overlap covers the straight-line reach of each stage, so widths near a core edge can still differ from an untiled run
+    where channel connectivity or an island extends beyond it.
+    the distance map is capped at DISTANCE_CAP pixels (default 256, as in Earth Engine), which also bounds the overlap;
+    DISTANCE_CAP = None is not supported here and raises a ValueError.
+    with a DemProvider (dem) the hill shadow comes from whole DEM tiles, so it needs no overlap; each worker keeps its own tile cache.
+    """
+
+    from functions_local import ClipToBounds, Window
+    from functions_tile_local import TileHalo, TileWindows, ConcatTables
+
+    if DISTANCE_CAP is None:
+        raise ValueError('rwGenSRLocalTiled needs a finite DISTANCE_CAP (pixels) to bound the tile overlap; use rwGenSRLocal for an uncapped distance map')
+    if grwl is None:
+        grwl = []
+
+    def tempFUN(image, aoi = aoi):
+        if aoi is not None:
+            image = ClipToBounds(image, aoi)
+
+        hillShadowDistance = 9000 if ('dem' in image.bands and dem is None) else 0
+        halo = TileHalo(image.get('scale'), MAXDISTANCE, FILL_SIZE, DISTANCE_CAP, hillShadowDistance)
+        tasks = [(Window(image, *window), core, WATER_METHOD, MAXDISTANCE, FILL_SIZE, grwl, DISTANCE_CAP, dem) for (window, core) in TileWindows(image.shape, TILE_SIZE, halo)]
+
+        if N_WORKERS > 1:
+            from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+            # // keep at most two tiles per worker in flight so the pickled windows do not pile up
+            tables = [None] * len(tasks)
+            pending = {}
+            with ProcessPoolExecutor(max_workers = N_WORKERS) as pool:
+                for n, task in enumerate(tasks):
+                    if len(pending) >= 2 * N_WORKERS:
+                        done, _ = wait(pending, return_when = FIRST_COMPLETED)
+                        for future in done:
+                            tables[pending.pop(future)] = future.result()
+                    pending[pool.submit(_RunTile, task)] = n
+                for future in pending:
+                    tables[pending[future]] = future.result()
+        else:
+            tables = [_RunTile(task) for task in tasks]
+
+        return(ConcatTables(tables))
+
+    return(tempFUN)
@@ -5,7 +5,7 @@ if __name__ == '__main__':
     import getopt
     import argparse
     import sys
-    from functions_landsat import id2Img
+    from functions_batch import export_one_image
     from rwc_landsat import rwGenSR
 
     parser = argparse.ArgumentParser(prog = 'rwc_landsat_one_image.py',
@@ -51,8 +51,6 @@ if __name__ == '__main__':
     ee.Initialize()
 
     # start of program
-    img = id2Img(IMG_ID)
-
     # in validation, clip the original image around the validation site
     if POINTMODE:
         aoi = ee.Geometry.Point([LONGITUDE, LATITUDE], "EPSG:4326").buffer(RADIUS).bounds()
@@ -62,15 +60,7 @@ if __name__ == '__main__':
         rwc = rwGenSR(WATER_METHOD = WATER_METHOD, MAXDISTANCE = MAXDISTANCE, FILL_SIZE = FILL_SIZE, MAXDISTANCE_BRANCH_REMOVAL = MAXDISTANCE_BRANCH_REMOVAL)
         exportPrefix = IMG_ID
 
-    widthOut = rwc(img)
-
-    taskWidth = (ee.batch.Export.table.toDrive(
-        collection = widthOut,
-        description = exportPrefix,
-        folder = OUTPUT_FOLDER,
-        fileNamePrefix = exportPrefix,
-        fileFormat = FORMAT))
-    taskWidth.start()
+    export_one_image(rwc, IMG_ID, exportPrefix, OUTPUT_FOLDER, FORMAT)
 
     print('')
     print(exportPrefix, 'will be exported to', OUTPUT_FOLDER, 'as', FORMAT, 'file')
@@ -0,0 +1,5 @@
+# /* the modules are flat scripts in RivWidthCloud_Python, imported by name as in the scripts themselves */
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,102 @@
+import functions_batch
+from functions_batch import JobLedger, TaskTracker, run_batch, param_hash
+
+class FakeTask(object):
+
+    def __init__(self, taskId):
+        self.id = taskId
+
+def FakeExports(monkeypatch, failing = ()):
+    submitted = []
+
+    def export(rwc, imgId, exportPrefix, *args):
+        if imgId in failing:
+            raise RuntimeError('no such scene')
+        submitted.append(exportPrefix)
+        return(FakeTask('task_{}'.format(len(submitted))))
+
+    monkeypatch.setattr(functions_batch, 'export_one_image', export)
+    monkeypatch.setattr(functions_batch, 'export_image_chunk', lambda rwc, chunk, exportPrefix, *args: export(rwc, chunk[0][0], exportPrefix))
+    return(submitted)
+
+def Jobs(n):
+    return([('scene{}'.format(k), 'scene{}'.format(k), None, param_hash({'k': k})) for k in range(n)])
+
+def test_run_batch_waits_and_records_final_states(tmp_path, monkeypatch):
+    FakeExports(monkeypatch)
+    ledger = JobLedger(str(tmp_path / 'ledger.sqlite'))
+    tracker = TaskTracker(2, statusProvider = lambda ids: dict((i, 'COMPLETED') for i in ids), sleep = lambda s: None, onFinish = ledger.finished)
+    run_batch(Jobs(5), None, '', 'csv', 2, tracker, ledger)
+    assert not tracker.active
+    states = [row[0] for row in ledger.db.execute('SELECT state FROM jobs')]
+    assert states == ['COMPLETED'] * 5
+
+def test_failed_retry_updates_export_prefix(tmp_path):
+    ledger = JobLedger(str(tmp_path / 'ledger.sqlite'))
+    ledger.failed('scene0', 'h', 'old_prefix', 'error')
+    ledger.failed('scene0', 'h', 'new_prefix', 'error')
+    assert ledger.db.execute('SELECT export_prefix, attempts FROM jobs').fetchone() == ('new_prefix', 2)
+
+def test_track_adds_a_task():
+    tracker = TaskTracker(1, statusProvider = lambda ids: {})
+    tracker.track('task')
+    assert tracker.active == set(['task'])
+
+def test_failed_chunk_is_split_without_charging_every_scene(tmp_path, monkeypatch):
+    submitted = FakeExports(monkeypatch)
+    ledger = JobLedger(str(tmp_path / 'ledger.sqlite'))
+    # // the chunk task (task_1) fails on the server, the per-scene retries succeed
+    tracker = TaskTracker(4, statusProvider = lambda ids: dict((i, 'FAILED' if i == 'task_1' else 'COMPLETED') for i in ids),
+        sleep = lambda s: None, onFinish = ledger.finished)
+    run_batch(Jobs(3), None, '', 'csv', 2, tracker, ledger, chunkSize = 3)
+    assert submitted[1:] == ['scene0', 'scene1', 'scene2']
+    rows = ledger.db.execute('SELECT state, attempts FROM jobs ORDER BY landsat_id').fetchall()
+    assert rows == [('COMPLETED', 1)] * 3
+
+def test_chunk_failing_to_submit_is_split(tmp_path, monkeypatch):
+    submitted = FakeExports(monkeypatch, failing = ['scene0'])
+    ledger = JobLedger(str(tmp_path / 'ledger.sqlite'))
+    tracker = TaskTracker(4, statusProvider = lambda ids: dict((i, 'COMPLETED') for i in ids), sleep = lambda s: None, onFinish = ledger.finished)
+    run_batch(Jobs(3), None, '', 'csv', 2, tracker, ledger, chunkSize = 3)
+    assert submitted == ['scene1', 'scene2']
+    rows = ledger.db.execute('SELECT landsat_id, state, attempts FROM jobs ORDER BY landsat_id').fetchall()
+    assert rows == [('scene0', 'FAILED', 1), ('scene1', 'COMPLETED', 1), ('scene2', 'COMPLETED', 1)]
+
+def test_reconcile_fails_jobs_of_unknown_tasks(tmp_path):
+    ledger = JobLedger(str(tmp_path / 'ledger.sqlite'))
+    ledger.submitted('scene0', 'h', 'prefix0', 'running')
+    ledger.submitted('scene1', 'h', 'prefix1', 'expired')
+    assert ledger.reconcile(lambda ids: {'running': 'RUNNING'}) == ['running']
+    assert ledger.get('scene1', 'h') == ('FAILED', 'expired', 1)
+    assert ledger.db.execute("SELECT error FROM jobs WHERE landsat_id = 'scene1'").fetchone() == ('task status unknown',)
+    assert ledger.should_run('scene1', 'h', 2)
+    assert not ledger.should_run('scene1', 'h', 1)
+    assert not ledger.should_run('scene0', 'h', 2)
+
+class FakeEe(object):
+    """the parts of the ee module used by ee_task_status"""
+
+    class EEException(Exception):
+        pass
+
+    def __init__(self, operations):
+        self.operations = operations
+        self.data = self
+
+    def getOperation(self, name):
+        for operation in self.operations:
+            if operation['name'] == name:
+                return(operation)
+        raise FakeEe.EEException('not found')
+
+    def listOperations(self):
+        return(list(self.operations))
+
+def test_ee_task_status_uses_operations(monkeypatch):
+    import sys
+    fake = FakeEe([{'name': 'projects/p/operations/A', 'metadata': {'state': 'PENDING'}},
+        {'name': 'projects/p/operations/B', 'metadata': {'state': 'SUCCEEDED'}},
+        {'name': 'projects/p/operations/C', 'metadata': {'state': 'CANCELLED'}}])
+    monkeypatch.setitem(sys.modules, 'ee', fake)
+    states = functions_batch.ee_task_status(['A', 'B', 'projects/p/operations/C', 'projects/p/operations/D', 'E'])
+    assert states == {'A': 'READY', 'B': 'COMPLETED', 'projects/p/operations/C': 'CANCELLED'}
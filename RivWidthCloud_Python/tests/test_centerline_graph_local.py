@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from functions_centerline_graph_local import CleanCenterlineGraph
+from functions_centerline_width_local import CleanCenterline, SkeletonizeBits
+
+def Spurs():
+    # // a main line with vertical and diagonal spurs around the 10 pixel (300 m) limit, a loop and a short isolated segment
+    cl = np.zeros((60, 120), dtype = bool)
+    cl[30, 5:115] = True
+    for (col, length) in [(15, 3), (30, 9), (45, 10), (60, 11), (75, 25)]:
+        cl[30 - length:30, col] = True
+    for k in range(1, 9):
+        cl[30 + k, 90 + k] = True
+    cl[31:44, 20] = True
+    cl[43, 20:35] = True
+    cl[31:44, 34] = True
+    cl[50, 50:55] = True
+    return(cl)
+
+def RiverSkeleton():
+    rows, cols = np.indices((120, 300))
+    center = 60 + 20 * np.sin(cols / 25.0)
+    mask = np.abs(rows - center) < 9
+    mask |= (np.abs(cols - 120 + 0.6 * rows) < 5) & (rows < center)
+    mask &= ~((rows - center) ** 2 / 16.0 + (cols - 210) ** 2 / 400.0 < 1)
+    return(SkeletonizeBits(mask, None, 1))
+
+@pytest.mark.parametrize('rmCorners', [True, False])
+@pytest.mark.parametrize('cl', [Spurs(), RiverSkeleton()], ids = ['spurs', 'river'])
+def test_graph_cleaning_matches_cumulative_cost(cl, rmCorners):
+    for maxLength in (150, 300):
+        assert np.array_equal(CleanCenterlineGraph(cl, maxLength, rmCorners, 30), CleanCenterline(cl, maxLength, rmCorners, 30))
+
+def test_spurs_within_the_limit_are_removed():
+    cl = Spurs()
+    cleaned = CleanCenterlineGraph(cl, 300, False, 30)
+    # // every pixel within 300 m of a free end goes, then the new end pixel: spurs of up to 11 pixels disappear
+    # // and the 25 pixel one keeps 25 - 11 - 1 pixels
+    assert [int(cleaned[:30, col].sum()) for col in (15, 30, 45, 60, 75)] == [0, 0, 0, 0, 13]
+    assert not cleaned[50].any()
@@ -0,0 +1,139 @@
+import math
+import numpy as np
+import pytest
+from collections import OrderedDict
+from scipy import ndimage
+from functions_local import LocalImage, PixelCoordinates, PixelIndices
+from functions_centerline_width_local import CumulativeCost, Skeletonize, SkeletonizeBits, CalcDistanceMapExact, Dilate
+from functions_centerline_width_local import CalculateAngle, CalculateAnglePoints, CalculateCenterline, GetWidth
+
+def RandomMask(seed, shape = (37, 150)):
+    # // width not a multiple of 64, so the padding bits of the last word are exercised
+    return(np.random.RandomState(seed).rand(*shape) < 0.55)
+
+def RiverMask(shape = (90, 200)):
+    # // a meandering channel with a tributary and an island, i.e. the shapes the centerline is computed on
+    rows, cols = np.indices(shape)
+    center = shape[0] * 0.5 + 15 * np.sin(cols / 18.0)
+    mask = np.abs(rows - center) < 7
+    mask |= (np.abs(cols - 0.4 * shape[1] + 0.5 * rows) < 4) & (rows < center)
+    mask &= ~((rows - center) ** 2 / 9.0 + (cols - 0.7 * shape[1]) ** 2 / 100.0 < 1)
+    return(mask)
+
+def SkeletonizeToConvergence(image, method):
+    previous = image.astype(bool)
+    while True:
+        result = Skeletonize(previous, 1, method)
+        if np.array_equal(result, previous):
+            return(result)
+        previous = result
+
+@pytest.mark.parametrize('method', [1, 2])
+@pytest.mark.parametrize('mask', [RandomMask(0), RandomMask(1), RiverMask()], ids = ['random0', 'random1', 'river'])
+def test_skeletonize_bits_matches_kernels(mask, method):
+    for iterations in (1, 2, 5):
+        assert np.array_equal(SkeletonizeBits(mask, iterations, method), Skeletonize(mask, iterations, method))
+    assert np.array_equal(SkeletonizeBits(mask, None, method), SkeletonizeToConvergence(mask, method))
+
+def test_cumulative_cost_does_not_pass_disallowed_pixels():
+    # // (0, 2) only touches the source through the disallowed pixel (1, 1); a relaxation sweep reading the
+    # // cost it is updating reached it through (1, 1) within one iteration
+    allowed = np.array([[0, 0, 1], [1, 0, 0]], dtype = bool)
+    source = np.array([[0, 0, 0], [1, 0, 0]], dtype = bool)
+    cost = CumulativeCost(allowed, source, 100, 1)
+    assert cost[1, 0] == 0
+    assert np.isinf(cost[0, 2])
+
+def test_cumulative_cost_path_length():
+    allowed = np.ones((3, 4), dtype = bool)
+    source = np.zeros((3, 4), dtype = bool)
+    source[1, 0] = True
+    cost = CumulativeCost(allowed, source, 100, 30)
+    assert np.isclose(cost[1, 3], 90)
+    assert np.isclose(cost[0, 1], 30 * np.sqrt(2))
+    assert np.isinf(CumulativeCost(allowed, source, 60, 30)[1, 3])
+
+@pytest.mark.parametrize('maxDistance', [None, 4])
+def test_distance_map_matches_scipy_edt(maxDistance):
+    mask = RiverMask()
+    scale = 30
+    outline = Dilate(mask, 2) & ~Dilate(mask, 1)
+    edt = ndimage.distance_transform_edt(~outline, sampling = scale)
+    valid = Dilate(mask, 2)
+    if maxDistance is not None:
+        valid &= edt <= maxDistance * scale
+    DM = CalcDistanceMapExact(mask, scale, maxDistance)
+    assert np.array_equal(np.isnan(DM), ~valid)
+    assert np.allclose(DM[valid], edt[valid])
+    # // the widest part of the channel lies beyond the cap
+    assert maxDistance is None or np.any(Dilate(mask, 2) & ~valid)
+
+def test_angle_points_match_kernel_angle():
+    cl = SkeletonizeBits(RiverMask(), None, 1)
+    # // centerline pixels on the image border exercise the ring lookups outside the image
+    cl[0, 10:20] = cl[:, -1] = True
+    rows, cols = np.nonzero(cl)
+    expected = CalculateAngle(cl)[rows, cols]
+    assert np.array_equal(CalculateAnglePoints(rows, cols, cl.shape), expected, equal_nan = True)
+
+def SampleRegion(values, valid, rows, cols):
+    nr, nc = valid.shape
+    inside = (rows >= 0) & (rows < nr) & (cols >= 0) & (cols < nc)
+    rows = rows[inside]
+    cols = cols[inside]
+    keep = valid[rows, cols]
+    return(values[rows[keep], cols[keep]])
+
+def LoopXsections(clAngleNorm, segmentInfo, endInfo, DM, transform, footprint, scale):
+    # // the cross sections measured one centerline pixel at a time, as GetWidth did before it was vectorized
+    rows, cols = np.nonzero(np.isfinite(clAngleNorm) & np.isfinite(DM))
+    xs, ys = PixelCoordinates(transform, rows, cols)
+    radius = int(math.ceil(30.0 / scale))
+    dr, dc = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    inBuffer = np.hypot(dr, dc) * scale <= 30
+    dr = dr[inBuffer]
+    dc = dc[inBuffer]
+    columns = OrderedDict((k, []) for k in ['any', 'count'] + list(segmentInfo.keys()))
+    for k in range(len(rows)):
+        orthRad = clAngleNorm[rows[k], cols[k]] / 180 * math.pi
+        width = DM[rows[k], cols[k]] * 1.5
+        p1 = (xs[k] + width * math.cos(orthRad), ys[k] + width * math.sin(orthRad))
+        p2 = (xs[k] - width * math.cos(orthRad), ys[k] - width * math.sin(orthRad))
+        endValues = []
+        for p in (p1, p2):
+            r, c = PixelIndices(transform, p[0], p[1])
+            endValues.append(SampleRegion(endInfo, footprint, np.floor(r).astype(np.int64) + dr, np.floor(c).astype(np.int64) + dc))
+        endValues = np.concatenate(endValues)
+        t = np.linspace(0, 1, int(math.ceil(2 * width / scale * 4)) + 1)
+        r, c = PixelIndices(transform, p1[0] + (p2[0] - p1[0]) * t, p1[1] + (p2[1] - p1[1]) * t)
+        lineIdx = np.unique(np.stack([np.floor(r).astype(np.int64), np.floor(c).astype(np.int64)]), axis = 1)
+        columns['any'].append(int(np.any(endValues != 0)))
+        columns['count'].append(len(endValues))
+        for name in segmentInfo:
+            values = SampleRegion(segmentInfo[name], footprint, lineIdx[0], lineIdx[1]).astype(np.float64)
+            values = values[np.isfinite(values)]
+            columns[name].append(values.mean() if len(values) else np.nan)
+    return(OrderedDict((k, np.array(v, dtype = np.float64)) for k, v in columns.items()))
+
+def test_vectorized_width_matches_loop():
+    mask = RiverMask()
+    transform = (30, 0, 500000, 0, -30, 4000000)
+    # // part of the scene outside the footprint, and the river running off the image edges
+    footprint = np.ones(mask.shape, dtype = bool)
+    footprint[:, 150:170] = False
+    image = LocalImage({'riverMask': mask.astype(np.uint8)}, transform, 'EPSG:32616', {'image_id': 'scene'}, footprint)
+    centerline = CalculateCenterline(image)
+    cl = centerline.band('cleanedCL')
+    angle = np.full(cl.shape, np.nan)
+    angle[cl] = CalculateAngle(cl)[cl]
+    DM = centerline.band('distanceMap')
+    flag = np.random.RandomState(0).rand(*mask.shape)
+    flag[flag < 0.1] = np.nan
+    segmentInfo = OrderedDict([('channelMask', mask.astype(np.uint8)), ('flag', flag)])
+    endInfo = mask.astype(np.uint8)
+
+    expected = LoopXsections(angle, segmentInfo, endInfo, DM, transform, footprint, 30)
+    widths = GetWidth(angle, segmentInfo, endInfo, DM, 'EPSG:32616', transform, footprint, 30, 'scene', '', (np.zeros(mask.shape), np.zeros(mask.shape)))
+    assert len(expected['any']) > 100
+    for name in expected:
+        assert np.allclose(widths[name], expected[name], equal_nan = True), name
@@ -0,0 +1,36 @@
+import math
+import numpy as np
+from functions_dem_local import DemProvider
+
+def test_hill_shadow_tile_scales_east_west_by_cos_latitude(tmp_path):
+    # // a 300 m north-south wall on a 1 degree tile at 60N, sun due east 30 degrees above the horizon
+    n = 1000
+    dem = np.zeros((n, n), dtype = np.float32)
+    dem[:, 500] = 300
+    np.save(str(tmp_path / 'n60e000_dem.npy'), dem)
+    provider = DemProvider(str(tmp_path), tileDegrees = 1)
+    shadow = provider.HillShadowTile(180, 29, 90, 60)
+
+    lat = 61.0 - (n // 2 + 0.5) / n
+    xScale = 111320.0 / n * math.cos(math.radians(lat))
+    expected = 300 / math.tan(math.radians(30)) / xScale
+    shaded = int(np.sum(shadow[n // 2, :500] == 0))
+    assert abs(shaded - expected) <= 1
+    assert np.all(shadow[n // 2, 501:] == 1)
+
+def test_grid_lookups_use_precomputed_lon_lat(tmp_path, monkeypatch):
+    import functions_dem_local
+    from functions_dem_local import DemOnGrid, HillShadowOnGrid
+    from functions_local import PixelLonLat
+    dem = np.random.RandomState(0).rand(200, 200).astype(np.float32) * 500
+    np.save(str(tmp_path / 'n60e000_dem.npy'), dem)
+    provider = DemProvider(str(tmp_path), tileDegrees = 1)
+    shape, transform, crs = (50, 40), (0.004, 0, 0.3, 0, -0.004, 60.7), 'EPSG:4326'
+    lonLat = PixelLonLat(shape, transform, crs)
+    expected = (DemOnGrid(provider, shape, transform, crs), HillShadowOnGrid(provider, shape, transform, crs, 120, 50))
+
+    def fail(*args):
+        raise AssertionError('grid reprojected again')
+    monkeypatch.setattr(functions_dem_local, 'PixelLonLat', fail)
+    assert np.array_equal(DemOnGrid(provider, shape, transform, crs, lonLat), expected[0])
+    assert np.array_equal(HillShadowOnGrid(provider, shape, transform, crs, 120, 50, lonLat), expected[1])
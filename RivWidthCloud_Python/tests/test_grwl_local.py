@@ -0,0 +1,31 @@
+import numpy as np
+from functions_local import LocalImage, XYToLonLat
+from functions_grwl_local import GrwlIndex
+
+def Lines(seed = 0, n = 40):
+    # // random polylines over a UTM 16N area of about 12 x 12 km
+    rs = np.random.RandomState(seed)
+    lines = []
+    for k in range(n):
+        x = 500000 + np.cumsum(rs.randn(20) * 300) + rs.rand() * 12000
+        y = 4000000 - np.cumsum(rs.randn(20) * 300) - rs.rand() * 12000
+        lon, lat = XYToLonLat(x, y, 'EPSG:32616')
+        lines.append(np.stack([lon, lat], 1))
+    return(lines)
+
+def Scene(r0, c0, shape = (300, 320), dx = 0.0):
+    transform = (30.0, 0.0, 500000.0 + (c0 + dx) * 30, 0.0, -30.0, 4000000.0 - r0 * 30)
+    return(LocalImage({'B': np.zeros(shape, dtype = np.uint8)}, transform, 'EPSG:32616', {'WRS_PATH': 22, 'WRS_ROW': 35}))
+
+def test_scenes_of_a_path_row_share_one_painting():
+    index = GrwlIndex(Lines())
+    calls = []
+    paint = index.Paint
+    index.Paint = lambda *args: calls.append(args[0]) or paint(*args)
+    scenes = [Scene(0, 0), Scene(20, -15), Scene(10, 5, (250, 280)), Scene(3, 0, dx = 0.5)]
+    for scene in scenes:
+        painted = index.PaintImage(scene)
+        assert np.array_equal(painted, paint(scene.shape, scene.transform, scene.crs))
+    # // the first scene, the union with the shifted one, none for the scene inside it, and one for the misaligned grid
+    assert calls == [(300, 320), (320, 335), (300, 320)]
+    assert np.any(index.PaintImage(scenes[0]))
@@ -0,0 +1,40 @@
+import time
+import numpy as np
+from functions_local import LocalImage
+from functions_incremental_local import IncrementalCenterline
+
+def RiverAndLake(n = 800, bump = False):
+    # // a meandering river 20 pixels wide and, far from it, a lake 300 pixels across
+    rows, cols = np.indices((n, n))
+    center = n * 0.25 + 25 * np.sin(cols / 60.0)
+    mask = np.abs(rows - center) < 10
+    mask |= (rows - 0.7 * n) ** 2 + (cols - 0.6 * n) ** 2 < 150 ** 2
+    if bump:
+        # // a small bar attached to the bank of the river
+        mask[(rows - (center + 10)) ** 2 + (cols - 200) ** 2 < 5 ** 2] = True
+    return(LocalImage({'riverMask': mask.astype(np.uint8)}, (30, 0, 500000, 0, -30, 4000000), 'EPSG:32616'))
+
+def Equal(a, b):
+    return(all(np.array_equal(a.band(k), b.band(k), equal_nan = a.band(k).dtype.kind == 'f') for k in IncrementalCenterline.PRODUCTS))
+
+def test_localized_change_is_exact_and_recomputes_a_small_window():
+    before, after = RiverAndLake(), RiverAndLake(bump = True)
+    incremental = IncrementalCenterline()
+    incremental.Update(before)
+
+    start = time.perf_counter()
+    updated = incremental.Update(after)
+    tIncremental = time.perf_counter() - start
+    start = time.perf_counter()
+    full = IncrementalCenterline().Update(after)
+    tFull = time.perf_counter() - start
+
+    assert Equal(updated, full)
+    # // the lake elsewhere in the scene does not widen the window around the bar
+    assert incremental.recomputed < 0.15 * after.band('riverMask').size
+    assert tIncremental < 0.5 * tFull
+
+def test_capped_distance_map_is_exact():
+    incremental = IncrementalCenterline(distanceCap = 64)
+    incremental.Update(RiverAndLake())
+    assert Equal(incremental.Update(RiverAndLake(bump = True)), IncrementalCenterline(distanceCap = 64).Update(RiverAndLake(bump = True)))
@@ -0,0 +1,12 @@
+import numpy as np
+from functions_local import LocalImage
+from functions_landsat_local import AddFmaskSR, DecodeQASR
+
+def test_decode_qa_matches_unpacked_bits():
+    qa = np.arange(2 ** 11, dtype = np.uint16).reshape(32, 64)
+    img = LocalImage({'BQA': qa}, (30, 0, 0, 0, -30, 0), 'EPSG:32616')
+    decoded = DecodeQASR(qa)
+    fmask = AddFmaskSR(img).band('fmask')
+    assert np.array_equal(decoded['fmask'], fmask)
+    for (name, c) in [('flag_cloud', 4), ('flag_cldShadow', 2), ('flag_snowIce', 3), ('flag_water', 1)]:
+        assert np.array_equal(decoded[name], (fmask == c).astype(decoded[name].dtype))
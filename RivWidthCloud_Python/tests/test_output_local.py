@@ -0,0 +1,73 @@
+import os
+import numpy as np
+import pytest
+from collections import OrderedDict
+from functions_output_local import WidthWriter
+
+pa = pytest.importorskip('pyarrow')
+
+IDS = ['LC08_L1TP_022034_20130422_20170310_01_T1', 'LC08_L1TP_022034_20130508_20170309_01_T1', 'LC08_L1TP_023034_20130429_20170310_01_T1']
+
+def Table(imageId, n, seed):
+    rs = np.random.RandomState(seed)
+    return(OrderedDict([
+        ('longitude', -87 + rs.rand(n)),
+        ('latitude', 36 + rs.rand(n)),
+        ('width', rs.rand(n) * 300),
+        ('flag_cloud', rs.randint(0, 2, n).astype(np.uint8)),
+        ('image_id', np.full(n, imageId, dtype = object))]))
+
+def ReadAll(directory, fmt):
+    tables = {}
+    for folder in sorted(os.listdir(directory)):
+        parts = []
+        for name in sorted(os.listdir(os.path.join(directory, folder))):
+            path = os.path.join(directory, folder, name)
+            if fmt == 'arrow':
+                with pa.ipc.open_file(path) as reader:
+                    parts.append(reader.read_all())
+            else:
+                import pyarrow.parquet as pq
+                parts.append(pq.read_table(path))
+        tables[folder] = pa.concat_tables(parts)
+    return(tables)
+
+@pytest.mark.parametrize('fmt', ['parquet', 'geoparquet', 'arrow'])
+def test_round_trip_partitioned_by_path_row(tmp_path, fmt):
+    tables = [Table(imageId, 50 + 10 * k, k) for (k, imageId) in enumerate(IDS)]
+    with WidthWriter(str(tmp_path), fmt, 'path_row', rowGroupSize = 32) as writer:
+        for (k, table) in enumerate(tables):
+            writer.write(table, timestamp = 1000 * k)
+
+    read = ReadAll(str(tmp_path), fmt)
+    assert sorted(read) == ['path_row=022034', 'path_row=023034']
+    for (folder, expected) in [('path_row=022034', tables[:2]), ('path_row=023034', tables[2:])]:
+        table = read[folder]
+        for name in expected[0]:
+            values = np.concatenate([t[name] for t in expected])
+            assert table.column(name).to_pylist() == values.tolist()
+        assert table.schema.field('flag_cloud').type == pa.uint8()
+        assert ('geometry' in table.column_names) == (fmt == 'geoparquet')
+
+def test_whole_floats_are_cast_to_the_stored_int_type(tmp_path):
+    later = Table(IDS[1], 40, 1)
+    later['flag_cloud'] = later['flag_cloud'].astype(np.float64)
+    with WidthWriter(str(tmp_path), 'parquet', None) as writer:
+        writer.write(Table(IDS[0], 40, 0), timestamp = 0)
+        writer.write(later, timestamp = 1)
+    import pyarrow.parquet as pq
+    table = pq.read_table(str(tmp_path / 'part-0.parquet'))
+    assert table.schema.field('flag_cloud').type == pa.uint8()
+    assert table.num_rows == 80
+
+def test_mismatched_tables_raise(tmp_path):
+    writer = WidthWriter(str(tmp_path), 'parquet', None, rowGroupSize = 10)
+    writer.write(Table(IDS[0], 20, 0), timestamp = 0)
+    extra = Table(IDS[1], 20, 1)
+    extra['Point_ID'] = np.arange(20)
+    with pytest.raises(ValueError, match = 'Point_ID'):
+        writer.write(extra, timestamp = 1)
+    lossy = Table(IDS[1], 20, 1)
+    lossy['flag_cloud'] = lossy['flag_cloud'] + 0.5
+    with pytest.raises(ValueError, match = 'flag_cloud'):
+        writer.write(lossy, timestamp = 1)
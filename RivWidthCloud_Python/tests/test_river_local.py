@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from functions_river_local import RemoveIsland
+from functions_components_local import ConnectedToSeeds
+
+def Channel(holes):
+    # // a water body with square-ish islands of the given pixel counts, each in its own block of rows
+    size = 60
+    channel = np.ones((size * len(holes), 200), dtype = np.uint8)
+    for (k, n) in enumerate(holes):
+        side = int(np.ceil(np.sqrt(n)))
+        island = np.zeros(side * side, dtype = np.uint8)
+        island[:n] = 1
+        channel[k * size + 5:k * size + 5 + side, 10:10 + side][island.reshape(side, side) == 1] = 0
+    return(channel)
+
+@pytest.mark.parametrize('FILL_SIZE', [333, 1500])
+def test_remove_island_size_limit_is_exact(FILL_SIZE):
+    # // islands smaller than FILL_SIZE are filled, FILL_SIZE and larger are kept, also beyond the 1024 pixel
+    # // limit of connectedPixelCount
+    channel = Channel([FILL_SIZE - 1, FILL_SIZE, FILL_SIZE + 1])
+    river = RemoveIsland(channel, FILL_SIZE, np.ones(channel.shape, dtype = bool))
+    assert np.sum(river == 0) == 2 * FILL_SIZE + 1
+    assert np.all(river[:60] == 1)
+
+def test_connected_to_seeds_follows_connectivity():
+    mask = np.array([[1, 0, 0], [0, 1, 0], [0, 0, 0], [1, 1, 0]], dtype = bool)
+    seeds = np.zeros(mask.shape, dtype = bool)
+    seeds[0, 0] = True
+    assert np.array_equal(ConnectedToSeeds(mask, seeds, 8), [[1, 0, 0], [0, 1, 0], [0, 0, 0], [0, 0, 0]])
+    assert np.array_equal(ConnectedToSeeds(mask, seeds, 4), [[1, 0, 0], [0, 0, 0], [0, 0, 0], [0, 0, 0]])
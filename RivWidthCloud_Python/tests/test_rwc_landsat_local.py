@@ -0,0 +1,48 @@
+import numpy as np
+import functions_local
+import functions_dem_local
+from functions_local import LocalImage, XYToLonLat
+from functions_dem_local import DemProvider
+from rwc_landsat_local import rwGenSRLocal, rwGenSRLocalSeries
+
+def Scene(nr = 120, nc = 200):
+    # // a meandering river in a UTM 16N scene near 36N 87W, with its GRWL centerline
+    rows, cols = np.indices((nr, nc))
+    center = nr / 2 + 15 * np.sin(cols / 40.0)
+    water = np.abs(rows - center) <= 8
+
+    def band(w, l):
+        return(np.where(water, w, l).astype(np.int16))
+    bands = {'Blue': band(500, 400), 'Green': band(800, 700), 'Red': band(500, 600), 'Nir': band(300, 3000),
+        'Swir1': band(100, 2000), 'Swir2': band(50, 1200), 'BQA': band(324, 322)}
+    transform = (30.0, 0.0, 500000.0, 0.0, -30.0, 4000000.0)
+    x = 500000 + (np.arange(nc) + 0.5) * 30
+    y = 4000000 - (center[0] + 0.5) * 30
+    lon, lat = XYToLonLat(x, y, 'EPSG:32616')
+    image = LocalImage(bands, transform, 'EPSG:32616', {'LANDSAT_ID': 'TEST', 'system:time_start': 0,
+        'SOLAR_AZIMUTH_ANGLE': 140, 'SOLAR_ZENITH_ANGLE': 40})
+    return(image, [np.stack([lon, lat], 1)])
+
+def CountReprojections(monkeypatch):
+    calls = []
+    original = functions_local.PixelLonLat
+
+    def counted(*args):
+        calls.append(args[0])
+        return(original(*args))
+    monkeypatch.setattr(functions_local, 'PixelLonLat', counted)
+    monkeypatch.setattr(functions_dem_local, 'PixelLonLat', counted)
+    return(calls)
+
+def test_series_reprojects_the_grid_once(tmp_path, monkeypatch):
+    np.save(str(tmp_path / 'n35w090_dem.npy'), np.random.RandomState(0).rand(100, 100).astype(np.float32) * 300)
+    image, grwl = Scene()
+    expected = rwGenSRLocal(grwl = grwl, dem = DemProvider(str(tmp_path)))(image)
+
+    calls = CountReprojections(monkeypatch)
+    widths = list(rwGenSRLocalSeries(grwl = grwl, dem = DemProvider(str(tmp_path)))([image, image, image]))
+    assert len(calls) == 1
+    assert len(expected['width']) > 0
+    for table in widths:
+        for name in expected:
+            assert np.array_equal(np.asarray(table[name]), np.asarray(expected[name])), name
@@ -0,0 +1,12 @@
+import pytest
+from functions_tile_local import TileHalo
+from rwc_landsat_local import rwGenSRLocalTiled
+
+def test_uncapped_distance_map_is_rejected():
+    with pytest.raises(ValueError):
+        TileHalo(30, 4000, 333, None)
+    with pytest.raises(ValueError):
+        rwGenSRLocalTiled(DISTANCE_CAP = None)
+
+def test_halo_covers_capped_cross_sections():
+    assert TileHalo(30, 0, 1, 256) == 384 + 1 + 2
@@ -0,0 +1,15 @@
+import numpy as np
+from functions_local import LocalImage
+from functions_waterClassification_Jones2019_local import Dswe, DsweLUT, DsweIndex
+
+def RandomScene(n = 200000, seed = 0):
+    # // reflectances spread around the DSWE thresholds so that every combination of the five tests occurs
+    rng = np.random.default_rng(seed)
+    bands = dict((name, rng.integers(-100, 4000, size = (n // 500, 500)).astype(np.int16))
+        for name in ['Blue', 'Green', 'Red', 'Nir', 'Swir1', 'Swir2'])
+    return(LocalImage(bands, (30, 0, 0, 0, -30, 0), 'EPSG:32616'))
+
+def test_dswe_lookup_table_matches_dswe():
+    img = RandomScene()
+    assert len(np.unique(DsweIndex(img))) == 32
+    assert np.array_equal(DsweLUT(img), Dswe(img))